@@ -0,0 +1,179 @@
+"""
+Building blocks of the JSON API served under /api/v1.
+
+Each resource declares the fields a client may ask for with the fields query
+string argument, and the column each one is read from. A query selects the
+columns of the requested fields only, and joins the tables they come from only
+when one of them is requested, so payload size and database work follow what
+the client asks for.
+
+Responses are encoded with orjson when the package is installed and
+API_FAST_JSON is set in config.py, and with the json module otherwise. Both
+produce the same bytes.
+"""
+import json
+from collections import namedtuple
+from datetime import date
+
+from flask import Response, current_app, request
+
+from models import Venue, Artist, Show, db
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+Field = namedtuple('Field', ['column', 'join'])
+
+
+class InvalidFields(ValueError):
+  pass
+
+
+class Resource(object):
+  """
+  The fields of an API resource, and how to select them.
+
+  Parameters
+  ----------
+  model : db.Model
+    The model the resource is read from.
+  fields : dict[str, Field]
+    The selectable fields, each with its column and the name of the join it
+    needs, if any.
+  default_fields : list[str]
+    The fields returned when the request does not name any.
+  joins : dict[str, tuple], optional
+    The (model, onclause) of each join named by the fields.
+  nested_fields : list[str], optional
+    Fields filled in by the caller rather than selected, e.g. the shows of a
+    venue, only available on detail endpoints.
+  """
+
+  def __init__(self, model, fields, default_fields, joins=None, nested_fields=()):
+    self.model = model
+    self.fields = fields
+    self.default_fields = default_fields
+    self.joins = joins or {}
+    self.nested_fields = list(nested_fields)
+
+  def parse_fields(self, detail=False):
+    """
+    Reads the comma-separated fields query string argument, keeping the
+    requested order and dropping duplicates.
+
+    Parameters
+    ----------
+    detail : bool
+      Whether the request is for a single entity, on which nested fields are
+      available and returned by default.
+
+    Returns
+    -------
+    list[str]
+      The requested fields.
+
+    Raises
+    ------
+    InvalidFields
+      If a requested field does not exist.
+    """
+    allowed = list(self.fields) + (self.nested_fields if detail else [])
+    fields = request.args.get('fields')
+    if fields is None:
+      return self.default_fields + (self.nested_fields if detail else [])
+    names = list(dict.fromkeys(name.strip() for name in fields.split(',') if name.strip()))
+    unknown = [name for name in names if name not in allowed]
+    if unknown or not names:
+      raise InvalidFields(f"Unknown fields: {', '.join(unknown)}. Available fields: {', '.join(allowed)}.")
+    return names
+
+  def query(self, names):
+    """
+    Builds the query selecting the given fields, each labelled with its name,
+    and joining only the tables they need. Nested field names are ignored.
+
+    Returns
+    -------
+    sqlalchemy.orm.Query
+      The unordered query.
+    """
+    names = [name for name in names if name in self.fields] or ['id']
+    query = db.session.query(*[self.fields[name].column.label(name) for name in names])\
+      .select_from(self.model)
+    for join in dict.fromkeys(self.fields[name].join for name in names if self.fields[name].join):
+      query = query.join(*self.joins[join])
+    return query
+
+  def to_dict(self, row, names):
+    """
+    Converts a row of query(names) into the resource data.
+    """
+    return {name: getattr(row, name) for name in names if name in self.fields}
+
+
+def _default(value):
+  if isinstance(value, date):
+    return value.isoformat()
+  raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps(payload):
+  """
+  Encodes the payload as compact UTF-8 JSON, with dates and datetimes in ISO
+  8601 format.
+  """
+  if orjson is not None and current_app.config.get('API_FAST_JSON'):
+    return orjson.dumps(payload)
+  return json.dumps(payload, default=_default, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def json_response(payload, status=200):
+  return Response(dumps(payload), status=status, mimetype='application/json')
+
+
+def _entity_fields(model, *names):
+  return {name: Field(getattr(model, name), None) for name in names}
+
+
+VENUES = Resource(
+  Venue,
+  _entity_fields(
+    Venue, 'id', 'name', 'genres', 'address', 'city', 'state', 'phone', 'website_link',
+    'facebook_link', 'seeking_talent', 'seeking_description', 'image_link',
+    'upcoming_shows_count', 'past_shows_count'
+  ),
+  default_fields=['id', 'name', 'city', 'state', 'upcoming_shows_count'],
+  nested_fields=['past_shows', 'upcoming_shows'],
+)
+
+ARTISTS = Resource(
+  Artist,
+  _entity_fields(
+    Artist, 'id', 'name', 'genres', 'city', 'state', 'phone', 'website_link',
+    'facebook_link', 'seeking_venue', 'seeking_description', 'image_link',
+    'upcoming_shows_count', 'past_shows_count'
+  ),
+  default_fields=['id', 'name', 'upcoming_shows_count'],
+  nested_fields=['past_shows', 'upcoming_shows'],
+)
+
+SHOWS = Resource(
+  Show,
+  {
+    'id': Field(Show.id, None),
+    'venue_id': Field(Show.venue_id, None),
+    'venue_name': Field(Venue.name, 'venue'),
+    'venue_image_link': Field(Venue.image_link, 'venue'),
+    'artist_id': Field(Show.artist_id, None),
+    'artist_name': Field(Artist.name, 'artist'),
+    'artist_image_link': Field(Artist.image_link, 'artist'),
+    'start_time': Field(Show.start_time, None),
+  },
+  default_fields=['id', 'venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link', 'start_time'],
+  joins={
+    'venue': (Venue, Show.venue_id == Venue.id),
+    'artist': (Artist, Show.artist_id == Artist.id),
+  },
+)
@@ -1,37 +1,337 @@
 #----------------------------------------------------------------------------#
 # Imports
 #----------------------------------------------------------------------------#
+import io
 import sys
 import json
+import hmac
+import hashlib
 import dateutil.parser
-import babel
 from flask import (render_template,
                    request,
+                   abort,
                    redirect,
                    jsonify,
                    url_for,
-                   flash)
+                   flash,
+                   Response,
+                   make_response,
+                   session,
+                   stream_with_context)
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
-from models import Venue, Artist, Show, app, db
+from models import Venue, Artist, Show, ShowArchiveSummary, FacetCount, TableVersion, app, db
+from search_index import search_index
+from pagination import keyset_paginate, InvalidCursor
+from page_cache import page_cache
+from show_counters import rollover_scheduler
+from db_pool import pool_stats
+from replica import read_only, mark_written, reads_from_replica
+from formatting import format_datetime
+from sql_stats import sql_stats
+import api
+import bulk_import
+import export
+import facet_counts
+import seed
+import show_partitions
 
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
-
 app.jinja_env.filters['datetime'] = format_datetime
 
+search_index.init_app(app)
+page_cache.init_app(app)
+rollover_scheduler.init_app(app)
+sql_stats.init_app(app)
+
+#----------------------------------------------------------------------------#
+# Streaming.
+#----------------------------------------------------------------------------#
+
+def stream_template(template_name, **context):
+  """
+  Renders a template as a stream of chunks instead of a single string, so the
+  response can be sent while iterables in the context are still being read.
+
+  Parameters
+  ----------
+  template_name : str
+    The template to render.
+  **context
+    The template variables.
+
+  Returns
+  -------
+  jinja2.environment.TemplateStream
+    The rendered template chunks.
+  """
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  stream = template.stream(context)
+  stream.enable_buffering(app.config['STREAM_BUFFER_SIZE'])
+  return stream
+
+#----------------------------------------------------------------------------#
+# Conditional requests.
+#----------------------------------------------------------------------------#
+
+def conditional_response(validators, render, last_modified=None):
+  """
+  Answers a GET request with 304 Not Modified when the client already holds
+  the current version of the page, and renders it otherwise.
+
+  The ETag is a hash of the request path and query string and of the given
+  validators, which must change whenever the page would. Pages with pending
+  flashed messages are always rendered, since the messages are part of them.
+
+  Parameters
+  ----------
+  validators : tuple
+    Cheap-to-compute values identifying the version of the page.
+  render : callable
+    Renders the page, only called when the client's copy is out of date.
+  last_modified : datetime, optional
+    When the page last changed, sent as the Last-Modified header.
+
+  Returns
+  -------
+  Response
+    The 304 or rendered response, carrying the ETag.
+  """
+  etag = hashlib.sha1(repr((request.full_path, validators)).encode()).hexdigest()
+  if '_flashes' not in session and request.if_none_match.contains(etag):
+    response = Response(status=304)
+  else:
+    response = make_response(render())
+  response.set_etag(etag)
+  response.last_modified = last_modified
+  response.cache_control.no_cache = True
+  return response
+
+def find_listing_validators(*table_names):
+  """
+  Retrieves the validators of a listing page from the TableVersion rows of the
+  tables it reads, which change on every insert, update and delete.
+
+  Parameters
+  ----------
+  *table_names : str
+    The tables the page reads.
+
+  Returns
+  -------
+  validators: tuple
+    The validators of the page.
+  """
+  versions = db.session.query(TableVersion.table_name, TableVersion.updated_at)\
+    .filter(TableVersion.table_name.in_(table_names))\
+    .order_by(TableVersion.table_name)\
+    .all()
+  return tuple(versions)
+
+def find_detail_validators(model, model_id):
+  """
+  Retrieves the validators of a venue or artist page in one aggregated query:
+  the updated_at of the entity, of its shows and of the artists or venues
+  they are with, the number of shows, and the number of upcoming shows, which
+  changes when one of them starts.
+
+  Parameters
+  ----------
+  model : Venue or Artist
+    The model of the entity shown on the page.
+  model_id : int
+    The entity ID in the database.
+
+  Returns
+  -------
+  (tuple, datetime)
+    The validators of the page, and when the page last changed.
+  """
+  return format_detail_validators(detail_validators_query(model, model_id).first())
+
+def detail_validators_query(model, model_id):
+  """
+  Builds the aggregated query behind find_detail_validators.
+
+  Returns
+  -------
+  sqlalchemy.orm.Query
+    The query, not yet executed.
+  """
+  if model is Venue:
+    show_key, other_model, other_key = Show.venue_id, Artist, Show.artist_id
+  else:
+    show_key, other_model, other_key = Show.artist_id, Venue, Show.venue_id
+
+  return db.session.query(
+    model.updated_at,\
+    db.func.max(Show.updated_at),\
+    db.func.max(other_model.updated_at),\
+    db.func.count(Show.id),\
+    db.func.count(Show.id).filter(Show.start_time > datetime.now())
+  )\
+  .outerjoin(Show, show_key == model.id)\
+  .outerjoin(other_model, other_key == other_model.id)\
+  .filter(model.id == model_id)\
+  .group_by(model.id)
+
+def format_detail_validators(validators):
+  """
+  Converts the row of detail_validators_query into the validators and last
+  modification time of the page, or (None, None) if the entity is missing.
+  """
+  if validators is None:
+    return None, None
+  validators = tuple(validators)
+  return validators, max(timestamp for timestamp in validators[:3] if timestamp is not None)
+
+#----------------------------------------------------------------------------#
+# Pagination.
+#----------------------------------------------------------------------------#
+
+def get_page_args():
+  """
+  Reads the keyset pagination arguments of a listing page from the query
+  string: the page size (limit), and the after or before cursor.
+
+  Returns
+  -------
+  dict
+    Keyword arguments for keyset_paginate.
+  """
+  limit = request.args.get('limit', app.config['PAGE_SIZE'], type=int)
+  return {
+    "limit": max(1, min(limit, app.config['MAX_PAGE_SIZE'])),
+    "after": request.args.get('after'),
+    "before": request.args.get('before')
+  }
+
+def page_links(page):
+  """
+  Builds the next and previous page URLs of a listing page, keeping the other
+  query string arguments of the current request.
+
+  Parameters
+  ----------
+  page : Page
+    The page being rendered.
+
+  Returns
+  -------
+  pagination: dict
+    The next_url and prev_url of the page, None where there is no such page.
+  """
+  args = request.args.to_dict(flat=False)
+  args.pop('after', None)
+  args.pop('before', None)
+  return {
+    "next_url": url_for(request.endpoint, after=page.next_cursor, **args) if page.next_cursor else None,
+    "prev_url": url_for(request.endpoint, before=page.prev_cursor, **args) if page.prev_cursor else None
+  }
+
+class InvalidGenres(ValueError):
+  pass
+
+def genre_filter(column):
+  """
+  Builds the genre filter of a listing page from the genre query string
+  arguments, e.g. ?genre=Jazz&genre=Blues. Rows with any of the genres match,
+  or with all of them when match=all is given too. Genres are normalized as
+  in the forms, so that the array operators, && and @>, can use the GIN
+  index on the column.
+
+  Parameters
+  ----------
+  column : Column
+    The genres column, Venue.genres or Artist.genres.
+
+  Returns
+  -------
+  ClauseElement
+    The filter, true when no genre is given.
+
+  Raises
+  ------
+  InvalidGenres
+    If a genre is not one of the form choices.
+  """
+  genres = normalize_genres(request.args.getlist('genre'))
+  unknown = [genre for genre in genres if genre not in GENRES]
+  if unknown:
+    raise InvalidGenres(f"Unknown genres: {', '.join(unknown)}. Available genres: {', '.join(GENRES)}.")
+  if not genres:
+    return db.true()
+  if request.args.get('match') == 'all':
+    return column.contains(genres)
+  return column.overlap(genres)
+
+def get_genre_args():
+  """
+  Reads the normalized genres and match mode of a listing page, for
+  templates to describe the genre filter.
+  """
+  return {
+    "genres": normalize_genres(request.args.getlist('genre')),
+    "match_all": request.args.get('match') == 'all'
+  }
+
+def find_facet_counts(entity, genres):
+  """
+  Retrieves the facet counts shown next to a listing page in one lookup on
+  the primary key of FacetCount: the number of venues or artists with each
+  genre, in each state and in each city, at most FACET_LIMIT of each, the
+  most common first.
+
+  Counts are scoped to the genre the listing is filtered on, if it is
+  filtered on exactly one, and cover all venues or artists otherwise. Counts
+  are not kept for combinations of genres, so a listing filtered on several
+  gets the counts of all venues or artists, with the genres in unscoped for
+  the page to say so.
+
+  Example of facets, for venues filtered on Jazz:
+  {
+    "scope": "Jazz",
+    "unscoped": [],
+    "genre": [{"value": "Jazz", "count": 412}, {"value": "Blues", "count": 97}],
+    "state": [{"value": "CA", "count": 1203}],
+    "city": [{"value": "San Francisco, CA", "count": 87}]
+  }
+
+  Parameters
+  ----------
+  entity : str
+    'venue' or 'artist'.
+  genres : list[str]
+    The normalized genres the listing is filtered on.
+
+  Returns
+  -------
+  facets: dict
+    The scope genre, None for all, the genres the counts are not scoped to,
+    and the counts of each facet.
+  """
+  scope = genres[0] if len(genres) == 1 else ''
+  facet_results = db.session.query(FacetCount.facet, FacetCount.value, FacetCount.count)\
+    .filter(FacetCount.entity == entity, FacetCount.scope == scope, FacetCount.count > 0)\
+    .order_by(FacetCount.facet, FacetCount.count.desc(), FacetCount.value)\
+    .all()
+
+  facets = {
+    "scope": scope or None, "unscoped": genres if len(genres) > 1 else [],
+    "genre": [], "state": [], "city": []
+  }
+  for facet, value, count in facet_results:
+    if len(facets[facet]) < app.config['FACET_LIMIT']:
+      facets[facet].append({"value": value, "count": count})
+  return facets
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -45,9 +345,12 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@read_only
 def venues():
   """
-  Retrieves venues data from the database.
+  Retrieves one page of venues data from the database. The page is selected
+  with the limit, after and before query string arguments, and the venues
+  with the genre and match arguments documented in genre_filter.
 
   Example of areas data:
   data=[{
@@ -82,35 +385,75 @@ def venues():
     Venue data from the database.
   """
 
-  data = []
+  venue_filter = genre_filter(Venue.genres)
 
-  city_state_results = db.session.query(Venue.city, Venue.state).group_by(Venue.city, Venue.state).all()
-  city_venues_result_list = []
-  for city_state in city_state_results:
-    city, state = city_state[0], city_state[1]
-    venues = db.session.query(Venue)\
-      .filter(Venue.city == city)\
-      .filter(Venue.state == state)\
-      .all()
-    venues_result_list = []
-    for venue in venues:
-      venue_id = venue.id
-      venue_name = venue.name
-      num_upcoming_shows = search_num_upcoming_shows_by_venue(venue_id)
-      venues_result_list.append({
-        "id": venue_id,
-        "name": venue_name,
-        "num_upcoming_shows": num_upcoming_shows
-      })
-    data.append({
-      "city": city,
-      "state": state,
-      "venues": venues_result_list
+  def render():
+    page = find_venues_by_area(venue_filter=venue_filter, **get_page_args())
+    genre_args = get_genre_args()
+    return render_template(
+      'pages/venues.html', areas=page.items, pagination=page_links(page), genre_args=genre_args,
+      facets=find_facet_counts('venue', genre_args["genres"])
+    )
+
+  return conditional_response(find_listing_validators('Venue'), render)
+
+def find_venues_by_area(limit, after=None, before=None, venue_filter=None):
+  """
+  Retrieves one page of venues grouped by city and state, together with their
+  number of upcoming shows, using a single query.
+
+  The number of upcoming shows is read from the counter materialized on each
+  venue. Venues are paginated by ID with keyset pagination, so the number of
+  round trips to the database and the cost of a page stay constant regardless
+  of the number of venues.
+
+  Parameters
+  ----------
+  limit : int
+    The number of venues per page.
+  after : str, optional
+    Cursor of the page to continue from.
+  before : str, optional
+    Cursor of the page to go back from.
+  venue_filter : ClauseElement, optional
+    A filter on the venues listed, e.g. from genre_filter.
+
+  Returns
+  -------
+  page: Page
+    The page, whose items are the venues grouped by area, in the format
+    expected by pages/venues.html.
+  """
+  venue_query = db.session.query(
+    Venue.city,\
+    Venue.state,\
+    Venue.id,\
+    Venue.name,\
+    Venue.upcoming_shows_count
+  )
+  if venue_filter is not None:
+    venue_query = venue_query.filter(venue_filter)
+  page = keyset_paginate(venue_query, [Venue.id], limit, after, before)
+
+  areas = {}
+  for venue in page.items:
+    city, state = venue[0], venue[1]
+    if (city, state) not in areas:
+      areas[(city, state)] = {
+        "city": city,
+        "state": state,
+        "venues": []
+      }
+    areas[(city, state)]["venues"].append({
+      "id": venue[2],
+      "name": venue[3],
+      "num_upcoming_shows": venue[4]
     })
 
-  return render_template('pages/venues.html', areas=data)
+  return page._replace(items=sorted(areas.values(), key=lambda area: (area["state"] or "", area["city"] or "")))
 
 @app.route('/venues/search', methods=['POST'])
+@read_only
 def search_venues():
   """
   Performs search on venues with partial string search. Search is case-insensitive.
@@ -140,13 +483,14 @@ def search_venues():
   data = []
 
   search_term = request.form.get('search_term', '')
-  search_results = db.session.query(Venue).filter(Venue.name.ilike(f'%{search_term}%')).all()
-  results_counts = len(search_results)
+  search_results = search_by_name(Venue, search_term)
+  results_counts = search_results[0].total if search_results else 0
+  upcoming_shows_counts = count_upcoming_shows_by_venues([result.id for result in search_results])
 
   for result in search_results:
     venue_id = result.id
     venue_name = result.name
-    num_upcoming_shows = search_num_upcoming_shows_by_venue(venue_id)
+    num_upcoming_shows = upcoming_shows_counts[venue_id]
     data.append({
       "id": venue_id,
       "name": venue_name,
@@ -160,6 +504,117 @@ def search_venues():
 
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
+@app.route('/venues/suggest')
+@read_only
+def suggest_venues():
+  """
+  Returns the venues whose name contains the search term, for
+  search-as-you-type. Served from the in-process search index when it is
+  enabled, so that lookups skip the database entirely.
+
+  Example of response:
+  {
+    "count": 1,
+    "data": [{
+      "id": 1,
+      "name": "The Musical Hop"
+    }]
+  }
+
+  Parameters
+  ----------
+  None
+
+  Returns
+  -------
+  response: json
+    The matching venue IDs and names.
+  """
+  return jsonify(suggest_by_name(Venue, request.args.get('search_term', '')))
+
+def search_by_name(model, search_term):
+  """
+  Performs a case-insensitive partial string search on the name of the given
+  model, ranking the matches by trigram similarity to the search term.
+
+  The ILIKE filter is served by the GIN trigram index on the name column. At
+  most SEARCH_RESULTS_LIMIT matches are returned, and the total number of
+  matches is computed in the same query with a window function. When the
+  in-process search index is enabled, it answers instead of the database.
+
+  Parameters
+  ----------
+  model : Venue or Artist
+    The model to search.
+  search_term : str
+    The partial name to search for.
+
+  Returns
+  -------
+  search_results: list[tuple]
+    The (id, name, total) rows of the best matches, where total is the number
+    of matches before the limit is applied.
+  """
+  if search_index.is_ready():
+    return search_index.search(model.__tablename__.lower(), search_term, app.config['SEARCH_RESULTS_LIMIT'])
+
+  similarity = db.func.similarity(model.name, search_term)
+  return db.session.query(
+    model.id,\
+    model.name,\
+    db.func.count().over().label('total')
+  )\
+  .filter(model.name.ilike(f'%{search_term}%'))\
+  .order_by(similarity.desc(), model.id)\
+  .limit(app.config['SEARCH_RESULTS_LIMIT'])\
+  .all()
+
+def suggest_by_name(model, search_term):
+  """
+  Builds the search-as-you-type response for the given model.
+
+  Parameters
+  ----------
+  model : Venue or Artist
+    The model to search.
+  search_term : str
+    The partial name to search for.
+
+  Returns
+  -------
+  response: dict
+    The number of matches and the IDs and names of the best ones.
+  """
+  search_results = search_by_name(model, search_term)
+  return {
+    "count": search_results[0].total if search_results else 0,
+    "data": [{"id": result.id, "name": result.name} for result in search_results]
+  }
+
+@app.route('/_stats/page-cache')
+def page_cache_stats():
+  """
+  Reports the hit, miss and eviction counters of the detail page cache of the
+  worker serving the request.
+  """
+  return jsonify(page_cache.stats())
+
+@app.route('/_stats/db-pool')
+def db_pool_stats():
+  """
+  Reports the state of the database connection pool of the worker serving the
+  request, and how long its checkouts waited for a connection.
+  """
+  return jsonify(pool_stats(db.engine))
+
+@app.route('/_stats/search-index')
+def search_index_stats():
+  """
+  Reports the size and memory use of the in-process search index of the
+  worker serving the request.
+  """
+  return jsonify(enabled=search_index.is_ready(), indexes=search_index.stats())
+
 def search_num_upcoming_shows_by_venue(venue_id):
   """
   Searches for the number of upcoming shows to be hosted at the specified venue.
@@ -174,12 +629,37 @@ def search_num_upcoming_shows_by_venue(venue_id):
   int
     The number of upcoming shows to be hosted at the specified venue.
   """
-  search_results = db.session.query(Show)\
-    .filter(Show.venue_id == venue_id)\
-    .filter(Show.start_time > datetime.now())\
+  return count_upcoming_shows_by_venues([venue_id])[venue_id]
+
+def count_upcoming_shows_by_venues(venue_ids):
+  """
+  Retrieves the number of upcoming shows to be hosted at each of the specified
+  venues with a single query on their materialized counters.
+
+  Example of upcoming_shows_counts:
+  {1: 0, 3: 1}
+
+  Parameters
+  ----------
+  venue_ids : list[int]
+    The venue IDs in the database.
+
+  Returns
+  -------
+  upcoming_shows_counts: dict[int, int]
+    The number of upcoming shows keyed by venue ID. Venues without upcoming
+    shows are mapped to 0.
+  """
+  upcoming_shows_counts = dict.fromkeys(venue_ids, 0)
+  if not upcoming_shows_counts:
+    return upcoming_shows_counts
+
+  count_results = db.session.query(Venue.id, Venue.upcoming_shows_count)\
+    .filter(Venue.id.in_(list(upcoming_shows_counts)))\
     .all()
 
-  return len(search_results)
+  upcoming_shows_counts.update(count_results)
+  return upcoming_shows_counts
 
 def search_num_past_shows_by_venue(venue_id):
   """
@@ -195,14 +675,10 @@ def search_num_past_shows_by_venue(venue_id):
   int
     The number of past shows to be hosted at the specified venue.
   """
-  search_results = db.session.query(Show)\
-    .filter(Show.venue_id == venue_id)\
-    .filter(Show.start_time <= datetime.now())\
-    .all()
-
-  return len(search_results)
+  return db.session.query(Venue.past_shows_count).filter(Venue.id == venue_id).scalar()
 
 @app.route('/venues/<int:venue_id>')
+@read_only
 def show_venue(venue_id):
   """
   Shows the venue page with the given venue_id.
@@ -244,6 +720,12 @@ def show_venue(venue_id):
     }],
     "past_shows_count": 1,
     "upcoming_shows_count": 1,
+    "archive": {
+      "shows_count": 0,
+      "first_start_time": None,
+      "last_start_time": None,
+      "top_artists": []
+    }
   }
 
   Parameters
@@ -257,7 +739,45 @@ def show_venue(venue_id):
     Data associated with the venue with the given venue_id.
   """
   
-  venue_data = db.session.query(
+  def render():
+    cache_key, venue_data = page_cache.lookup('venue', venue_id, validators)
+    if venue_data is None:
+      venue_data = find_venue(venue_id)
+      page_cache.store(cache_key, venue_data, expires_at=find_next_show_time(venue_data["upcoming_shows"]))
+    return render_template('pages/show_venue.html', venue=venue_data)
+
+  validators, last_modified = find_detail_validators(Venue, venue_id)
+  return conditional_response(validators, render, last_modified)
+
+def find_venue(venue_id):
+  """
+  Retrieves the data shown on the venue page with the given venue_id, in the
+  format documented in show_venue, in three queries: one for the venue, one
+  for its shows and one for the summary of its archived shows.
+
+  Parameters
+  ----------
+  venue_id : int
+    The venue ID in the database.
+
+  Returns
+  -------
+  venue_data: dict
+    Data associated with the venue with the given venue_id.
+  """
+  venue = venue_query(venue_id).first()
+  if venue is None:
+    abort(404)
+
+  shows = find_shows_by_entity(Show.venue_id, venue_id, Artist, Show.artist_id, 'artist')
+  archive = find_archive_summary(Show.venue_id, venue_id, Artist, Show.artist_id, 'artist')
+  return format_venue(venue, shows, archive)
+
+def venue_query(venue_id):
+  """
+  Builds the query selecting the columns of the venue shown on its page.
+  """
+  return db.session.query(
       Venue.id,\
       Venue.name,\
       Venue.genres,\
@@ -270,137 +790,254 @@ def show_venue(venue_id):
       Venue.seeking_talent,\
       Venue.seeking_description,\
       Venue.image_link
-    ).filter(Venue.id == venue_id).all()[0]
-
-  id, name, genres, address, city, state, phone, website_link, facebook_link, seeking_talent, seeking_description, image_link =\
-    venue_data[0], venue_data[1], venue_data[2], venue_data[3], venue_data[4], venue_data[5], venue_data[6], venue_data[7], venue_data[8], venue_data[9], venue_data[10], venue_data[11]
-
-  past_shows = find_past_shows_by_venue(id)
-  upcoming_shows = find_upcoming_shows_by_venue(id)
-  past_shows_count = len(past_shows)
-  upcoming_shows_count = len(upcoming_shows)
-
-  venue_data = {
-    "id": id,
-    "name": name,
-    "genres": genres,
-    "address": address,
-    "city": city,
-    "state": state,
-    "phone": phone,
-    "website_link": website_link,
-    "facebook_link": facebook_link,
-    "seeking_talent": seeking_talent,
-    "seeking_description": seeking_description,
-    "image_link": image_link,
-    "past_shows": past_shows,
-    "upcoming_shows": upcoming_shows,
-    "past_shows_count": past_shows_count,
-    "upcoming_shows_count": upcoming_shows_count
-  }
+    ).filter(Venue.id == venue_id)
 
-  return render_template('pages/show_venue.html', venue=venue_data)
+def format_venue(venue, shows, archive):
+  """
+  Combines the row of venue_query, the shows of the venue and the summary of
+  its archived shows into the venue data documented in show_venue. The past
+  show count includes the archived shows.
+  """
+  return {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": venue.genres,
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website_link": venue.website_link,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link,
+    "past_shows": shows["past_shows"],
+    "upcoming_shows": shows["upcoming_shows"],
+    "past_shows_count": shows["past_shows_count"] + archive["shows_count"],
+    "upcoming_shows_count": shows["upcoming_shows_count"],
+    "archive": archive
+  }
 
-def find_past_shows_by_venue(venue_id):
+def find_shows_by_entity(show_key, entity_id, other_model, other_key, prefix):
   """
-  Retreives all past shows hosted at the venue with the given venue ID.
-  
-  Example of past_show_list:
-  [{
-    "artist_id": 5,
-    "artist_name": "Matt Quevedo",
-    "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-    "start_time": "2019-06-15T23:00:00.000Z"
-  }]
+  Retrieves the past and upcoming shows of a venue or an artist in a single
+  query, split against a single "now" snapshot.
+
+  Shows are ranked within each side of "now" by their distance to it, so the
+  lists hold the most recent past shows and the soonest upcoming shows, at
+  most DETAIL_SHOWS_LIMIT of each. Their exact totals are computed in the same
+  query with window functions.
+
+  Example of shows, for a venue:
+  {
+    "past_shows": [{
+      "artist_id": 5,
+      "artist_name": "Matt Quevedo",
+      "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
+      "start_time": datetime(2019, 6, 15, 23, 0),
+      "start_time_display": None
+    }],
+    "upcoming_shows": [],
+    "past_shows_count": 1,
+    "upcoming_shows_count": 0
+  }
 
   Parameters
   ----------
-  venue_id : int
-    The venue ID in the database.
-  
+  show_key : Column
+    The Show column referencing the entity, Show.venue_id or Show.artist_id.
+  entity_id : int
+    The entity ID in the database.
+  other_model : Artist or Venue
+    The model of the other side of the shows.
+  other_key : Column
+    The Show column referencing other_model.
+  prefix : str
+    The prefix of the keys describing other_model in the show data, 'artist'
+    or 'venue'.
+
   Returns
   -------
-  past_show_list: list[dict]
-    The past shows data.
+  shows: dict
+    The past and upcoming shows, past ones latest first and upcoming ones
+    soonest first, and their total counts.
   """
-  past_show_list = []
-  past_shows_at_venue = db.session.query(
-    Show.artist_id,\
-    Artist.name,\
-    Artist.image_link,\
-    Show.start_time,\
-    Show
-  )\
-  .join(Artist, Show.artist_id == Artist.id)\
-  .filter(Show.venue_id == venue_id)\
-  .filter(Show.start_time <= datetime.now())\
-  .all()
-  for past_show in past_shows_at_venue:
-    artist_id, artist_name, artist_image_link, start_time = past_show[0], past_show[1], past_show[2], past_show[3]
-    start_time = start_time.strftime('%Y-%m-%d %H:%M:%S')
-    past_show_list.append({
-      "artist_id": artist_id,
-      "artist_name": artist_name,
-      "artist_image_link": artist_image_link,
-      "start_time": start_time
+  show_results = shows_by_entity_query(show_key, entity_id, other_model, other_key).all()
+  return format_shows_by_entity(show_results, prefix)
+
+def shows_by_entity_query(show_key, entity_id, other_model, other_key):
+  """
+  Builds the windowed query behind find_shows_by_entity.
+
+  Upcoming and past shows are ranked in two branches of a UNION ALL, each
+  restricted on start_time, so that the upcoming branch only reads the Show
+  partitions of the months ahead.
+
+  Returns
+  -------
+  sqlalchemy.orm.Query
+    The query, not yet executed.
+  """
+  now = datetime.now()
+  distance_to_now = db.func.abs(db.extract('epoch', Show.start_time - now))
+
+  def ranked_side(is_upcoming, side_filter):
+    return db.session.query(
+      other_key.label('other_id'),\
+      other_model.name.label('other_name'),\
+      other_model.image_link.label('other_image_link'),\
+      Show.start_time.label('start_time'),\
+      Show.start_time_display.label('start_time_display'),\
+      is_upcoming.label('is_upcoming'),\
+      db.func.row_number().over(order_by=(distance_to_now, Show.id)).label('rank'),\
+      db.func.count().over().label('total')
+    )\
+    .join(other_model, other_key == other_model.id)\
+    .filter(show_key == entity_id, side_filter)\
+    .statement
+
+  ranked_shows = db.union_all(
+    ranked_side(db.true(), Show.start_time > now),
+    ranked_side(db.false(), Show.start_time <= now)
+  ).alias()
+
+  return db.session.query(ranked_shows)\
+    .filter(ranked_shows.c.rank <= app.config['DETAIL_SHOWS_LIMIT'])\
+    .order_by(ranked_shows.c.rank)
+
+def format_shows_by_entity(show_results, prefix):
+  """
+  Converts the rows of shows_by_entity_query into the shows data documented
+  in find_shows_by_entity.
+  """
+  shows = {
+    "past_shows": [],
+    "upcoming_shows": [],
+    "past_shows_count": 0,
+    "upcoming_shows_count": 0
+  }
+  for show in show_results:
+    side = "upcoming" if show.is_upcoming else "past"
+    shows[f"{side}_shows"].append({
+      f"{prefix}_id": show.other_id,
+      f"{prefix}_name": show.other_name,
+      f"{prefix}_image_link": show.other_image_link,
+      "start_time": show.start_time,
+      "start_time_display": show.start_time_display
     })
-  return past_show_list
+    shows[f"{side}_shows_count"] = show.total
+  return shows
 
-def find_upcoming_shows_by_venue(venue_id):
+def find_archive_summary(show_key, entity_id, other_model, other_key, prefix):
   """
-  Retreives all upcoming shows to be hosted at the venue with the given venue ID.
-  
-  Example of upcoming_show_list:
-  [{
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-01T20:00:00.000Z"
-    }, {
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-08T20:00:00.000Z"
-    }, {
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-15T20:00:00.000Z"
-  }]
+  Retrieves the summary of the archived shows of a venue or an artist from
+  ShowArchiveSummary, in a single query: their number, first and last start
+  times, and the artists or venues they were most often with, at most
+  ARCHIVE_TOP_LIMIT of them.
+
+  Example of archive, for a venue:
+  {
+    "shows_count": 42,
+    "first_start_time": datetime(2019, 6, 15, 23, 0),
+    "last_start_time": datetime(2024, 9, 28, 21, 0),
+    "top_artists": [{
+      "artist_id": 5,
+      "artist_name": "Matt Quevedo",
+      "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
+      "shows_count": 12
+    }]
+  }
 
   Parameters
   ----------
-  venue_id : int
-    The venue ID in the database.
-  
+  show_key : Column
+    The Show column referencing the entity, Show.venue_id or Show.artist_id.
+  entity_id : int
+    The entity ID in the database.
+  other_model : Artist or Venue
+    The model of the other side of the shows.
+  other_key : Column
+    The Show column referencing other_model.
+  prefix : str
+    The prefix of the keys describing other_model in the summary, 'artist'
+    or 'venue'.
+
+  Returns
+  -------
+  archive: dict
+    The summary of the archived shows.
+  """
+  summary_results = archive_summary_query(show_key, entity_id, other_model, other_key).all()
+  return format_archive_summary(summary_results, prefix)
+
+def archive_summary_query(show_key, entity_id, other_model, other_key):
+  """
+  Builds the windowed query behind find_archive_summary, from the columns of
+  ShowArchiveSummary named as the given Show columns.
+
+  Returns
+  -------
+  sqlalchemy.orm.Query
+    The query, not yet executed.
+  """
+  summary_key = getattr(ShowArchiveSummary, show_key.key)
+  summary_other_key = getattr(ShowArchiveSummary, other_key.key)
+
+  return db.session.query(
+    summary_other_key.label('other_id'),\
+    other_model.name.label('other_name'),\
+    other_model.image_link.label('other_image_link'),\
+    ShowArchiveSummary.shows_count.label('shows_count'),\
+    db.cast(db.func.sum(ShowArchiveSummary.shows_count).over(), db.Integer).label('total'),\
+    db.func.min(ShowArchiveSummary.first_start_time).over().label('first_start_time'),\
+    db.func.max(ShowArchiveSummary.last_start_time).over().label('last_start_time')
+  )\
+  .join(other_model, summary_other_key == other_model.id)\
+  .filter(summary_key == entity_id)\
+  .order_by(ShowArchiveSummary.shows_count.desc(), ShowArchiveSummary.last_start_time.desc(), summary_other_key)\
+  .limit(app.config['ARCHIVE_TOP_LIMIT'])
+
+def format_archive_summary(summary_results, prefix):
+  """
+  Converts the rows of archive_summary_query into the archive data documented
+  in find_archive_summary.
+  """
+  archive = {
+    "shows_count": 0,
+    "first_start_time": None,
+    "last_start_time": None,
+    f"top_{prefix}s": []
+  }
+  for summary in summary_results:
+    archive[f"top_{prefix}s"].append({
+      f"{prefix}_id": summary.other_id,
+      f"{prefix}_name": summary.other_name,
+      f"{prefix}_image_link": summary.other_image_link,
+      "shows_count": summary.shows_count
+    })
+    archive["shows_count"] = summary.total
+    archive["first_start_time"] = summary.first_start_time
+    archive["last_start_time"] = summary.last_start_time
+  return archive
+
+def find_next_show_time(upcoming_shows):
+  """
+  Finds when the earliest of the given upcoming shows starts, which is when a
+  detail page listing them goes out of date.
+
+  Parameters
+  ----------
+  upcoming_shows : list[dict]
+    The upcoming shows data.
+
   Returns
   -------
-  upcoming_show_list: list[dict]
-    The upcoming shows data.
+  datetime or None
+    The start time of the earliest upcoming show, None if there is none.
   """
-
-  upcoming_show_list = []
-  upcoming_shows_at_venue = db.session.query(
-    Show.artist_id,\
-    Artist.name,\
-    Artist.image_link,\
-    Show.start_time,\
-    Show
-  )\
-  .join(Artist, Show.artist_id == Artist.id)\
-  .filter(Show.venue_id == venue_id)\
-  .filter(Show.start_time > datetime.now())\
-  .all()
-  for upcoming_show in upcoming_shows_at_venue:
-    artist_id, artist_name, artist_image_link, start_time = upcoming_show[0], upcoming_show[1], upcoming_show[2], upcoming_show[3]
-    start_time = start_time.strftime('%Y-%m-%d %H:%M:%S')
-    upcoming_show_list.append({
-      "artist_id": artist_id,
-      "artist_name": artist_name,
-      "artist_image_link": artist_image_link,
-      "start_time": start_time
-    })
-  return upcoming_show_list
+  if not upcoming_shows:
+    return None
+  return min(show["start_time"] for show in upcoming_shows)
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -438,7 +1075,7 @@ def create_venue_submission():
       state = request.form['state'],
       address = request.form['address'],
       phone = request.form['phone'],
-      genres = request.form.getlist('genres'),
+      genres = normalize_genres(request.form.getlist('genres')),
       image_link = request.form['image_link'],
       facebook_link = request.form['facebook_link'],
       website_link = request.form['website_link'],
@@ -447,6 +1084,8 @@ def create_venue_submission():
     )
     db.session.add(new_venue)
     db.session.commit()
+    search_index.update('venue', new_venue)
+    page_cache.bump('venue', new_venue.id)
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
   except:
     error = True
@@ -478,6 +1117,8 @@ def delete_venue(venue_id):
     venue = Venue.query.get(venue_id)
     db.session.delete(venue)
     db.session.commit()
+    search_index.remove('venue', venue_id)
+    page_cache.bump('venue', venue_id)
     flash('Venue ' + request.form['name'] + ' was successfully deleted!')
   except:
     error = True
@@ -491,9 +1132,13 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@read_only
 def artists():
   """
-  Retrieves all artists IDs and names in the database.
+  Retrieves one page of artists IDs and names in the database, ordered by ID.
+  The page is selected with the limit, after and before query string arguments,
+  and the artists with the genre and match arguments documented in
+  genre_filter.
 
   Example of artists data:
   artists = [{
@@ -517,14 +1162,21 @@ def artists():
     All artists IDs and names.
   """
 
-  artists_results = db.session.query(Artist.id, Artist.name)\
-    .group_by(Artist.id, Artist.name)\
-    .order_by(Artist.id)\
-    .all()
-  
-  return render_template('pages/artists.html', artists=artists_results)
+  artist_filter = genre_filter(Artist.genres)
+
+  def render():
+    artist_query = db.session.query(Artist.id, Artist.name).filter(artist_filter)
+    page = keyset_paginate(artist_query, [Artist.id], **get_page_args())
+    genre_args = get_genre_args()
+    return render_template(
+      'pages/artists.html', artists=page.items, pagination=page_links(page), genre_args=genre_args,
+      facets=find_facet_counts('artist', genre_args["genres"])
+    )
+
+  return conditional_response(find_listing_validators('Artist'), render)
 
 @app.route('/artists/search', methods=['POST'])
+@read_only
 def search_artists():
   """
   Performs search on artists with partial string search. Ensure it is case-insensitive.
@@ -554,13 +1206,14 @@ def search_artists():
   data = []
 
   search_term = request.form.get('search_term', '')
-  search_results = db.session.query(Artist).filter(Artist.name.ilike(f'%{search_term}%')).all()
-  results_counts = len(search_results)
+  search_results = search_by_name(Artist, search_term)
+  results_counts = search_results[0].total if search_results else 0
+  upcoming_shows_counts = count_upcoming_shows_by_artists([result.id for result in search_results])
 
   for result in search_results:
     artist_id = result.id
     artist_name = result.name
-    num_upcoming_shows = search_num_upcoming_shows_by_artist(artist_id)
+    num_upcoming_shows = upcoming_shows_counts[artist_id]
     data.append({
       "id": artist_id,
       "name": artist_name,
@@ -574,6 +1227,34 @@ def search_artists():
 
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
+@app.route('/artists/suggest')
+@read_only
+def suggest_artists():
+  """
+  Returns the artists whose name contains the search term, for
+  search-as-you-type. Served from the in-process search index when it is
+  enabled, so that lookups skip the database entirely.
+
+  Example of response:
+  {
+    "count": 1,
+    "data": [{
+      "id": 6,
+      "name": "The Wild Sax Band"
+    }]
+  }
+
+  Parameters
+  ----------
+  None
+
+  Returns
+  -------
+  response: json
+    The matching artist IDs and names.
+  """
+  return jsonify(suggest_by_name(Artist, request.args.get('search_term', '')))
+
 def search_num_upcoming_shows_by_artist(artist_id):
   """
   Searches for the number of upcoming shows to be perform by the specified artist.
@@ -588,14 +1269,40 @@ def search_num_upcoming_shows_by_artist(artist_id):
   int
     The number of upcoming shows to be performed by the artist.
   """
-  search_results = db.session.query(Show)\
-    .filter(Show.artist_id == artist_id)\
-    .filter(Show.start_time > datetime.now())\
+  return count_upcoming_shows_by_artists([artist_id])[artist_id]
+
+def count_upcoming_shows_by_artists(artist_ids):
+  """
+  Retrieves the number of upcoming shows to be performed by each of the
+  specified artists with a single query on their materialized counters.
+
+  Example of upcoming_shows_counts:
+  {4: 0, 6: 3}
+
+  Parameters
+  ----------
+  artist_ids : list[int]
+    The artist ids.
+
+  Returns
+  -------
+  upcoming_shows_counts: dict[int, int]
+    The number of upcoming shows keyed by artist ID. Artists without upcoming
+    shows are mapped to 0.
+  """
+  upcoming_shows_counts = dict.fromkeys(artist_ids, 0)
+  if not upcoming_shows_counts:
+    return upcoming_shows_counts
+
+  count_results = db.session.query(Artist.id, Artist.upcoming_shows_count)\
+    .filter(Artist.id.in_(list(upcoming_shows_counts)))\
     .all()
 
-  return len(search_results)
+  upcoming_shows_counts.update(count_results)
+  return upcoming_shows_counts
 
 @app.route('/artists/<int:artist_id>')
+@read_only
 def show_artist(artist_id):
   """
   Shows the artist page with the given artist_id.
@@ -622,6 +1329,12 @@ def show_artist(artist_id):
     "upcoming_shows": [],
     "past_shows_count": 1,
     "upcoming_shows_count": 0,
+    "archive": {
+      "shows_count": 0,
+      "first_start_time": None,
+      "last_start_time": None,
+      "top_venues": []
+    }
   }
 
   Parameters
@@ -635,133 +1348,82 @@ def show_artist(artist_id):
     The artist data associated with the given artist ID.
   """
 
-  artist_data = db.session.query(
-    Artist.id,\
-    Artist.name,\
-    Artist.genres,\
-    Artist.city,\
-    Artist.state,\
-    Artist.phone,\
-    Artist.facebook_link,\
-    Artist.seeking_venue,\
-    Artist.seeking_description,\
-    Artist.image_link,\
-    Artist.website_link,\
-  ).filter(Artist.id == artist_id).all()[0]
-
-  id, name, genres, city, state, phone, facebook_link, seeking_venue, seeking_description, image_link, website_link =\
-    artist_data[0], artist_data[1], artist_data[2], artist_data[3], artist_data[4], artist_data[5], artist_data[6], artist_data[7], artist_data[8], artist_data[9], artist_data[10]
-
-  past_shows = find_past_shows_by_artist(id)
-  upcoming_shows = find_upcoming_shows_by_artist(id)
-  past_shows_count = len(past_shows)
-  upcoming_shows_count = len(upcoming_shows)
-
-  artist_data = {
-    "id": id,
-    "name": name,
-    "genres": genres,
-    "city": city,
-    "state": state,
-    "phone": phone,
-    "facebook_link": facebook_link,
-    "seeking_venue": seeking_venue,
-    "seeking_description": seeking_description,
-    "image_link": image_link,
-    "website_link": website_link,
-    "past_shows": past_shows,
-    "upcoming_shows": upcoming_shows,
-    "past_shows_count": past_shows_count,
-    "upcoming_shows_count": upcoming_shows_count
-  }
+  def render():
+    cache_key, artist_data = page_cache.lookup('artist', artist_id, validators)
+    if artist_data is None:
+      artist_data = find_artist(artist_id)
+      page_cache.store(cache_key, artist_data, expires_at=find_next_show_time(artist_data["upcoming_shows"]))
+    return render_template('pages/show_artist.html', artist=artist_data)
 
-  return render_template('pages/show_artist.html', artist=artist_data)
+  validators, last_modified = find_detail_validators(Artist, artist_id)
+  return conditional_response(validators, render, last_modified)
 
-def find_past_shows_by_artist(artist_id):
+def find_artist(artist_id):
   """
-  Retrieves all past shows by the artist with the given artist_id.
-
-  Example of past_show_list:
-  [{
-    "venue_id": 4,
-    "venue_name": "The Musical Hop",
-    "venue_image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-    "start_time": "2019-05-21T21:30:00.000Z"
-  }]
+  Retrieves the data shown on the artist page with the given artist_id, in the
+  format documented in show_artist, in three queries: one for the artist, one
+  for their shows and one for the summary of their archived shows.
 
   Parameters
   ----------
   artist_id : int
-    The artist id.
+    The artist ID in the database.
 
   Returns
   -------
-  past_show_list: list[dict]
-    The past shows data.
+  artist_data: dict
+    Data associated with the artist with the given artist_id.
   """
-  past_show_list = []
-
-  past_shows_by_artist = db.session.query(
-    Show.venue_id,\
-    Venue.name,\
-    Venue.image_link,\
-    Show.start_time,\
-    Show
-  )\
-  .join(Venue, Show.venue_id == Venue.id)\
-  .filter(Show.artist_id == artist_id)\
-  .filter(Show.start_time <= datetime.now())\
-  .all()
+  artist = artist_query(artist_id).first()
+  if artist is None:
+    abort(404)
 
-  for past_show in past_shows_by_artist:
-    venue_id, venue_name, venue_image_link, start_time = past_show[0], past_show[1], past_show[2], past_show[3]
-    start_time = start_time.strftime('%Y-%m-%d %H:%M:%S')
-    past_show_list.append({
-      "venue_id": venue_id,
-      "venue_name": venue_name,
-      "venue_image_link": venue_image_link,
-      "start_time": start_time
-    })
-  return past_show_list
+  shows = find_shows_by_entity(Show.artist_id, artist_id, Venue, Show.venue_id, 'venue')
+  archive = find_archive_summary(Show.artist_id, artist_id, Venue, Show.venue_id, 'venue')
+  return format_artist(artist, shows, archive)
 
-def find_upcoming_shows_by_artist(artist_id):
+def artist_query(artist_id):
   """
-  Retrieves all upcoming shows by the artist with the given artist_id.
-
-  Parameters
-  ----------
-  artist_id : int
-    The artist id.
-
-  Returns
-  -------
-  upcoming_show_list: list[dict]
-    The upcoming shows data.
+  Builds the query selecting the columns of the artist shown on their page.
   """
-  upcoming_show_list = []
-
-  upcoming_shows_by_artist = db.session.query(
-    Show.venue_id,\
-    Venue.name,\
-    Venue.image_link,\
-    Show.start_time,\
-    Show
-  )\
-  .join(Venue, Show.venue_id == Venue.id)\
-  .filter(Show.artist_id == artist_id)\
-  .filter(Show.start_time > datetime.now())\
-  .all()
+  return db.session.query(
+    Artist.id,\
+    Artist.name,\
+    Artist.genres,\
+    Artist.city,\
+    Artist.state,\
+    Artist.phone,\
+    Artist.facebook_link,\
+    Artist.seeking_venue,\
+    Artist.seeking_description,\
+    Artist.image_link,\
+    Artist.website_link,\
+  ).filter(Artist.id == artist_id)
 
-  for upcoming_show in upcoming_shows_by_artist:
-    venue_id, venue_name, venue_image_link, start_time = upcoming_show[0], upcoming_show[1], upcoming_show[2], upcoming_show[3]
-    start_time = start_time.strftime('%Y-%m-%d %H:%M:%S')
-    upcoming_show_list.append({
-      "venue_id": venue_id,
-      "venue_name": venue_name,
-      "venue_image_link": venue_image_link,
-      "start_time": start_time
-    })
-  return upcoming_show_list
+def format_artist(artist, shows, archive):
+  """
+  Combines the row of artist_query, the shows of the artist and the summary
+  of their archived shows into the artist data documented in show_artist.
+  The past show count includes the archived shows.
+  """
+  return {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": artist.genres,
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link,
+    "website_link": artist.website_link,
+    "past_shows": shows["past_shows"],
+    "upcoming_shows": shows["upcoming_shows"],
+    "past_shows_count": shows["past_shows_count"] + archive["shows_count"],
+    "upcoming_shows_count": shows["upcoming_shows_count"],
+    "archive": archive
+  }
 
 #  Update
 #  ----------------------------------------------------------------
@@ -829,13 +1491,15 @@ def edit_artist_submission(artist_id):
     artist.city = request.form['city']
     artist.state = request.form['state']
     artist.phone = request.form['phone']
-    artist.genres = request.form.getlist('genres')
+    artist.genres = normalize_genres(request.form.getlist('genres'))
     artist.facebook_link = request.form['facebook_link']
     artist.image_link = request.form['image_link']
     artist.website_link = request.form['website_link']
     artist.seeking_venue = seeking_venue
     artist.seeking_description = seeking_description
     db.session.commit()
+    search_index.update('artist', artist)
+    page_cache.bump('artist', artist_id)
     flash('Artist ' + request.form['name'] + ' was successfully edited!')
   except:
     error = True
@@ -910,13 +1574,15 @@ def edit_venue_submission(venue_id):
     venue.city = request.form['city']
     venue.state = request.form['state']
     venue.phone = request.form['phone']
-    venue.genres = request.form.getlist('genres')
+    venue.genres = normalize_genres(request.form.getlist('genres'))
     venue.facebook_link = request.form['facebook_link']
     venue.image_link = request.form['image_link']
     venue.website_link = request.form['website_link']
     venue.seeking_talent = seeking_talent
     venue.seeking_description = seeking_description
     db.session.commit()
+    search_index.update('venue', venue)
+    page_cache.bump('venue', venue_id)
     flash('Venue ' + request.form['name'] + ' was successfully edited!')
   except:
     error = True
@@ -962,7 +1628,7 @@ def create_artist_submission():
       city = request.form['city'],
       state = request.form['state'],
       phone = request.form['phone'],
-      genres = request.form.getlist('genres'),
+      genres = normalize_genres(request.form.getlist('genres')),
       image_link = request.form['image_link'],
       facebook_link = request.form['facebook_link'],
       website_link = request.form['website_link'],
@@ -971,6 +1637,8 @@ def create_artist_submission():
     )
     db.session.add(new_artist)
     db.session.commit()
+    search_index.update('artist', new_artist)
+    page_cache.bump('artist', new_artist.id)
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
   except:
     error = True
@@ -983,13 +1651,59 @@ def create_artist_submission():
   return render_template('pages/home.html')
 
 
+#  Genres
+#  ----------------------------------------------------------------
+
+@app.route('/genres')
+@read_only
+def genres():
+  """
+  Shows the genres venues and artists can be browsed by, with their number
+  of venues and artists, each linking to the venues and artists listings
+  filtered on it.
+
+  Example of genres data:
+  genres = [{
+    "name": "Alternative",
+    "venue_count": 12,
+    "artist_count": 30,
+  }]
+
+  Returns
+  -------
+  genres: list[dict]
+    The genres of the form choices, and their counts.
+  """
+
+  def render():
+    return render_template('pages/genres.html', genres=find_genre_counts())
+
+  return conditional_response(find_listing_validators('Venue', 'Artist'), render)
+
+def find_genre_counts():
+  """
+  Retrieves the number of venues and of artists of every genre from
+  FacetCount, in the format documented in genres.
+  """
+  genre_counts = {genre: {"name": genre, "venue_count": 0, "artist_count": 0} for genre in GENRES}
+  count_results = db.session.query(FacetCount.entity, FacetCount.value, FacetCount.count)\
+    .filter(FacetCount.entity.in_(['venue', 'artist']), FacetCount.scope == '', FacetCount.facet == 'genre')\
+    .all()
+
+  for entity, genre, count in count_results:
+    if genre in genre_counts:
+      genre_counts[genre][f"{entity}_count"] = count
+  return list(genre_counts.values())
+
 #  Shows
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@read_only
 def shows():
   """
-  Displays list of shows at /shows
+  Displays list of shows at /shows, ordered by start time. The page is
+  selected with the limit, after and before query string arguments.
 
   Example of show_data:
   [{
@@ -1018,26 +1732,98 @@ def shows():
     The shows data recorded in the database.
   """
 
-  show_data = []
+  def render():
+    page = keyset_paginate(find_shows_query(), [Show.start_time, Show.id], **get_page_args())
+    show_data = [format_show(show) for show in page.items]
+    return render_template('pages/shows.html', shows=show_data, pagination=page_links(page))
 
-  show_results = db.session.query(Show.venue_id, Venue.name, Show.artist_id, Artist.name, Artist.image_link, Show.start_time, Show)\
+  return conditional_response(find_listing_validators('Show', 'Venue', 'Artist'), render)
+
+@app.route('/shows/all')
+@read_only
+def all_shows():
+  """
+  Streams the list of every show at /shows/all, ordered by start time.
+
+  The shows are read through a server-side cursor in batches of
+  STREAM_BATCH_SIZE rows and rendered with a streamed template, so the first
+  bytes reach the client before the query has finished, and memory use stays
+  constant regardless of the number of shows.
+
+  Parameters
+  ----------
+  None
+
+  Returns
+  -------
+  Response
+    The streamed shows page.
+  """
+  show_data = iter_shows(app.config['STREAM_BATCH_SIZE'])
+  return Response(stream_with_context(stream_template('pages/shows.html', shows=show_data)))
+
+def find_shows_query():
+  """
+  Builds the query joining every show with its venue and artist, selecting
+  the columns needed by pages/shows.html.
+
+  Returns
+  -------
+  sqlalchemy.orm.Query
+    The unordered shows query.
+  """
+  return db.session.query(Show.venue_id, Venue.name, Show.artist_id, Artist.name, Artist.image_link, Show.start_time, Show.start_time_display)\
     .join(Venue, Show.venue_id == Venue.id)\
-    .join(Artist, Show.artist_id == Artist.id)\
-    .all()
+    .join(Artist, Show.artist_id == Artist.id)
+
+def iter_shows(batch_size):
+  """
+  Yields every show, ordered by start time, reading batch_size rows at a time
+  from a server-side cursor.
 
+  Parameters
+  ----------
+  batch_size : int
+    The number of rows fetched from the cursor at a time.
+
+  Yields
+  ------
+  show: dict
+    The show data, in the format returned by format_show.
+  """
+  show_results = find_shows_query()\
+    .order_by(Show.start_time, Show.id)\
+    .execution_options(stream_results=True)\
+    .yield_per(batch_size)
   for show in show_results:
-    venue_id, venue_name, artist_id, artist_name, artist_image_link, start_time = show[0], show[1], show[2], show[3], show[4], show[5]
-    start_time = start_time.strftime('%Y-%m-%d %H:%M:%S')
-    show_data.append({
-      "venue_id": venue_id,
-      "venue_name": venue_name,
-      "artist_id": artist_id,
-      "artist_name": artist_name,
-      "artist_image_link": artist_image_link,
-      "start_time": start_time
-    })
-  
-  return render_template('pages/shows.html', shows=show_data)
+    yield format_show(show)
+
+def format_show(show):
+  """
+  Converts a row of find_shows_query into the show data used by
+  pages/shows.html.
+
+  Parameters
+  ----------
+  show : tuple
+    The (venue_id, venue_name, artist_id, artist_name, artist_image_link,
+    start_time, start_time_display) row.
+
+  Returns
+  -------
+  show_data: dict
+    The show data.
+  """
+  venue_id, venue_name, artist_id, artist_name, artist_image_link, start_time, start_time_display = show[0], show[1], show[2], show[3], show[4], show[5], show[6]
+  return {
+    "venue_id": venue_id,
+    "venue_name": venue_name,
+    "artist_id": artist_id,
+    "artist_name": artist_name,
+    "artist_image_link": artist_image_link,
+    "start_time": start_time,
+    "start_time_display": start_time_display
+  }
 
 @app.route('/shows/create')
 def create_shows():
@@ -1063,10 +1849,12 @@ def create_show_submission():
     new_show = Show(
       venue_id = request.form['venue_id'],
       artist_id = request.form['artist_id'],
-      start_time = request.form['start_time']
+      start_time = dateutil.parser.parse(request.form['start_time'])
     )
     db.session.add(new_show)
     db.session.commit()
+    page_cache.bump('venue', request.form['venue_id'])
+    page_cache.bump('artist', request.form['artist_id'])
     flash('Show was successfully listed!')
   except:
     error = True
@@ -1077,10 +1865,365 @@ def create_show_submission():
 
   return render_template('pages/home.html')
 
+#  API
+#  ----------------------------------------------------------------
+
+@app.route('/api/v1/venues')
+@read_only
+def api_venues():
+  """
+  Lists venues as JSON, ordered by ID. The fields returned are selected with
+  the fields query string argument, the page with the limit, after and before
+  arguments, and the venues with the genre and match arguments documented in
+  genre_filter.
+
+  Example of response:
+  {
+    "data": [{"id": 1, "name": "The Musical Hop"}],
+    "pagination": {"next_cursor": "WzFd", "prev_cursor": null, "next_url": "/api/v1/venues?after=WzFd&fields=id%2Cname", "prev_url": null}
+  }
+
+  Parameters
+  ----------
+  None
+
+  Returns
+  -------
+  Response
+    The JSON page of venues.
+  """
+  fields = api.VENUES.parse_fields()
+  venue_filter = genre_filter(Venue.genres)
+
+  def render():
+    return api_listing(api.VENUES, fields, [Venue.id], venue_filter)
+
+  return conditional_response(find_listing_validators('Venue'), render)
+
+@app.route('/api/v1/artists')
+@read_only
+def api_artists():
+  """
+  Lists artists as JSON, ordered by ID, in the format documented in
+  api_venues.
+  """
+  fields = api.ARTISTS.parse_fields()
+  artist_filter = genre_filter(Artist.genres)
+
+  def render():
+    return api_listing(api.ARTISTS, fields, [Artist.id], artist_filter)
+
+  return conditional_response(find_listing_validators('Artist'), render)
+
+@app.route('/api/v1/shows')
+@read_only
+def api_shows():
+  """
+  Lists shows as JSON, ordered by start time, in the format documented in
+  api_venues. Venues and artists are only joined when one of their fields is
+  requested.
+  """
+  fields = api.SHOWS.parse_fields()
+
+  def render():
+    return api_listing(api.SHOWS, fields, [Show.start_time, Show.id])
+
+  return conditional_response(find_listing_validators('Show', 'Venue', 'Artist'), render)
+
+def api_listing(resource, fields, order_by, *criteria):
+  """
+  Renders one page of a resource as JSON, selecting the requested fields only.
+
+  Parameters
+  ----------
+  resource : api.Resource
+    The resource listed.
+  fields : list[str]
+    The requested fields.
+  order_by : list[Column]
+    The sort key, which must uniquely identify a row.
+  criteria : ClauseElement
+    Filters on the rows listed.
+
+  Returns
+  -------
+  Response
+    The JSON page.
+  """
+  page = keyset_paginate(resource.query(fields).filter(*criteria), order_by, **get_page_args())
+  return api.json_response({
+    "data": [resource.to_dict(row, fields) for row in page.items],
+    "pagination": dict(next_cursor=page.next_cursor, prev_cursor=page.prev_cursor, **page_links(page))
+  })
+
+@app.route('/api/v1/venues/<int:venue_id>')
+@read_only
+def api_venue(venue_id):
+  """
+  Returns the venue with the given venue_id as JSON. The fields returned are
+  selected with the fields query string argument, which also accepts
+  past_shows and upcoming_shows, returned by default.
+
+  Example of response:
+  {
+    "data": {
+      "id": 1,
+      "name": "The Musical Hop",
+      "past_shows": [],
+      "upcoming_shows": [{
+        "artist_id": 4,
+        "artist_name": "Guns N Petals",
+        "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
+        "start_time": "2035-04-01T20:00:00"
+      }]
+    }
+  }
+
+  Parameters
+  ----------
+  venue_id : int
+    The venue ID in the database.
+
+  Returns
+  -------
+  Response
+    The JSON venue data.
+  """
+  fields = api.VENUES.parse_fields(detail=True)
+
+  def render():
+    venue_data = find_api_entity(api.VENUES, venue_id, fields, Show.venue_id, Artist, Show.artist_id, 'artist')
+    return api.json_response({"data": venue_data})
+
+  validators, last_modified = find_detail_validators(Venue, venue_id)
+  return conditional_response(validators, render, last_modified)
+
+@app.route('/api/v1/artists/<int:artist_id>')
+@read_only
+def api_artist(artist_id):
+  """
+  Returns the artist with the given artist_id as JSON, in the format
+  documented in api_venue.
+  """
+  fields = api.ARTISTS.parse_fields(detail=True)
+
+  def render():
+    artist_data = find_api_entity(api.ARTISTS, artist_id, fields, Show.artist_id, Venue, Show.venue_id, 'venue')
+    return api.json_response({"data": artist_data})
+
+  validators, last_modified = find_detail_validators(Artist, artist_id)
+  return conditional_response(validators, render, last_modified)
+
+@app.route('/api/v1/shows/<int:show_id>')
+@read_only
+def api_show(show_id):
+  """
+  Returns the show with the given show_id as JSON, in the format documented
+  in api_venue.
+  """
+  fields = api.SHOWS.parse_fields(detail=True)
+  return api.json_response({"data": find_api_entity(api.SHOWS, show_id, fields)})
+
+def find_api_entity(resource, entity_id, fields, show_key=None, other_model=None, other_key=None, prefix=None):
+  """
+  Retrieves the requested fields of a venue, artist or show. The past and
+  upcoming shows of a venue or artist are only queried when requested, with
+  find_shows_by_entity.
+
+  Parameters
+  ----------
+  resource : api.Resource
+    The resource of the entity.
+  entity_id : int
+    The entity ID in the database.
+  fields : list[str]
+    The requested fields.
+  show_key, other_model, other_key, prefix
+    The arguments of find_shows_by_entity for the entity.
+
+  Returns
+  -------
+  entity_data: dict
+    The requested fields of the entity.
+  """
+  row = resource.query(fields).filter(resource.model.id == entity_id).first()
+  if row is None:
+    abort(404)
+  shows = None
+  if any(field in resource.nested_fields for field in fields):
+    shows = find_shows_by_entity(show_key, entity_id, other_model, other_key, prefix)
+  return format_api_entity(resource, row, fields, shows)
+
+def format_api_entity(resource, row, fields, shows=None):
+  """
+  Converts the row of the resource query, and the shows of the entity when
+  nested fields are requested, into the entity data returned by the API.
+  """
+  entity_data = resource.to_dict(row, fields)
+  for field in fields:
+    if field in resource.nested_fields:
+      entity_data[field] = [
+        {key: value for key, value in show.items() if key != "start_time_display"}
+        for show in shows[field]
+      ]
+  return entity_data
+
+#  Import and export
+#  ----------------------------------------------------------------
+
+def check_bearer_token(setting):
+  """
+  Checks the bearer token of the request against the token in the given
+  config setting. The endpoint is disabled, with a 404, when no token is set.
+
+  Returns
+  -------
+  Response
+    The 401 response to return if the token is missing or wrong, else None.
+  """
+  token = app.config.get(setting)
+  if not token:
+    abort(404)
+  if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+    response = api.json_response({"error": "Invalid or missing token."}, 401)
+    response.headers['WWW-Authenticate'] = 'Bearer'
+    return response
+  return None
+
+IMPORT_CONTENT_TYPES = {
+  'text/csv': 'csv',
+  'application/x-ndjson': 'ndjson',
+  'application/jsonl': 'ndjson',
+}
+
+@app.route('/import/<entity>', methods=['POST'])
+def import_entities(entity):
+  """
+  Imports venues, artists or shows from the CSV or NDJSON request body with
+  bulk_import. The format is read from the format query string argument, or
+  from the content type. Requires the IMPORT_API_TOKEN bearer token.
+
+  Example of response:
+  {
+    "imported": 998,
+    "errors": [{"line": 12, "errors": {"state": ["Not a valid choice"]}}]
+  }
+
+  Parameters
+  ----------
+  entity : str
+    'venues', 'artists' or 'shows'.
+
+  Returns
+  -------
+  Response
+    The JSON import report.
+  """
+  if entity not in bulk_import.ENTITIES:
+    abort(404)
+  unauthorized = check_bearer_token('IMPORT_API_TOKEN')
+  if unauthorized:
+    return unauthorized
+
+  format = request.args.get('format') or IMPORT_CONTENT_TYPES.get(request.mimetype)
+  if format not in bulk_import.FORMATS:
+    return api.json_response({"error": f"Unknown format, use one of: {', '.join(bulk_import.FORMATS)}."}, 400)
+
+  # Batches are committed as they are loaded, so those loaded before the body
+  # turns out not to be valid UTF-8 are reported along with the error.
+  error = None
+  try:
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    result = bulk_import.import_rows(entity, stream, format)
+  except bulk_import.ImportInterrupted as interrupted:
+    result = interrupted.result
+    error = "The request body is not valid UTF-8."
+  mark_written()
+
+  for venue_id in result.venue_ids:
+    page_cache.bump('venue', venue_id)
+  for artist_id in result.artist_ids:
+    page_cache.bump('artist', artist_id)
+  if result.imported and entity != 'shows' and search_index.is_ready():
+    search_index.reconcile()
+
+  report = {
+    "imported": result.imported,
+    "errors": [{"line": row_error.line, "errors": row_error.errors} for row_error in result.errors]
+  }
+  if error is not None:
+    return api.json_response(dict(report, error=error), 400)
+  return api.json_response(report)
+
+@app.route('/export/<any(venues, artists, shows):entity>.<format>')
+def export_entities(entity, format):
+  """
+  Streams every venue, artist or show as NDJSON or CSV, gzip-compressed when
+  the format ends with .gz, e.g. /export/shows.csv.gz. The since query string
+  argument, an ISO 8601 time, limits the export to the rows updated since.
+  Full exports read from the read replica, if any, unless the client wrote
+  recently; exports given since always read from the primary. Requires the EXPORT_API_TOKEN bearer token.
+
+  Parameters
+  ----------
+  entity : str
+    'venues', 'artists' or 'shows'.
+  format : str
+    'ndjson' or 'csv', optionally followed by '.gz'.
+
+  Returns
+  -------
+  Response
+    The streamed export.
+  """
+  unauthorized = check_bearer_token('EXPORT_API_TOKEN')
+  if unauthorized:
+    return unauthorized
+  export_format, compress = export.parse_format(format)
+  if export_format is None:
+    abort(404)
+  since = request.args.get('since')
+  if since is not None:
+    try:
+      since = datetime.fromisoformat(since)
+    except ValueError:
+      return api.json_response({"error": "since must be an ISO 8601 time."}, 400)
+
+  # Clients that just wrote, and incremental exports, read from the primary.
+  replica = since is None and reads_from_replica()
+  chunks = export.iter_export(entity, export_format, since, compress, replica=replica)
+  response = Response(
+    stream_with_context(chunks),
+    mimetype='application/gzip' if compress else export.CONTENT_TYPES[export_format]
+  )
+  response.headers['Content-Disposition'] = f'attachment; filename={entity}.{format}'
+  return response
+
+def is_api_request():
+  return request.path.startswith('/api/')
+
 @app.errorhandler(404)
 def not_found_error(error):
+    if is_api_request():
+      return api.json_response({"error": "Not found."}, 404)
     return render_template('errors/404.html'), 404
 
+@app.errorhandler(InvalidCursor)
+def invalid_cursor_error(error):
+    if is_api_request():
+      return api.json_response({"error": "Invalid page cursor."}, 400)
+    return 'Invalid page cursor.', 400
+
+@app.errorhandler(InvalidGenres)
+def invalid_genres_error(error):
+    if is_api_request():
+      return api.json_response({"error": str(error)}, 400)
+    return str(error), 400
+
+@app.errorhandler(api.InvalidFields)
+def invalid_fields_error(error):
+    return api.json_response({"error": str(error)}, 400)
+
 @app.errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
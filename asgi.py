@@ -0,0 +1,282 @@
+"""
+Optional ASGI entry point, serving the venue and artist pages with async
+database access:
+
+  FYYUR_DATABASE_URI=postgresql://... uvicorn asgi:application --workers 4
+
+The venue and artist pages (/venues/<id>, /artists/<id>) and their JSON
+counterparts (/api/v1/venues/<id>, /api/v1/artists/<id>) are served here.
+Their queries are built by the same functions as the Flask views, and run
+with async SQLAlchemy sessions on an asyncpg engine. The page validators are
+read first, as the page cache is keyed by them. On a miss, the queries that
+do not depend on each other then run concurrently: the venue or artist,
+their past and upcoming shows, and the summary of their archived shows. The
+JSON pages are not cached, and run all their queries at once. The page
+itself is rendered, and conditional requests answered, by the Flask code
+within a request context built from the ASGI scope, so responses are the
+same as the Flask app's.
+
+Every other request is handed to the Flask app, which runs in a thread
+through asgiref's WSGI adapter. The WSGI entry point, app:app, is unchanged.
+
+Requires SQLAlchemy 1.4 or later, asyncpg and asgiref, and an ASGI server
+such as uvicorn.
+"""
+import asyncio
+import io
+import re
+import sys
+from collections import namedtuple
+
+try:
+  from asgiref.wsgi import WsgiToAsgi
+  from sqlalchemy.engine import make_url
+  from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+except ImportError:
+  raise RuntimeError('The ASGI entry point requires SQLAlchemy 1.4 or later, asyncpg and asgiref.')
+
+from flask import Response, render_template
+
+import api
+import app as fyyur
+from app import app
+from db_pool import async_engine_options
+from models import Venue, Artist, Show
+from page_cache import page_cache
+from replica import REPLICA_BIND, reads_from_replica
+
+DetailPage = namedtuple('DetailPage', ['kind', 'model', 'query', 'format', 'show_args', 'template', 'resource'])
+
+DETAIL_PAGES = {
+  'venue': DetailPage(
+    'venue', Venue, fyyur.venue_query, fyyur.format_venue,
+    (Show.venue_id, Artist, Show.artist_id, 'artist'), 'pages/show_venue.html', api.VENUES
+  ),
+  'artist': DetailPage(
+    'artist', Artist, fyyur.artist_query, fyyur.format_artist,
+    (Show.artist_id, Venue, Show.venue_id, 'venue'), 'pages/show_artist.html', api.ARTISTS
+  ),
+}
+
+ROUTES = [
+  (re.compile(r'^/venues/(\d+)$'), 'venue', False),
+  (re.compile(r'^/artists/(\d+)$'), 'artist', False),
+  (re.compile(r'^/api/v1/venues/(\d+)$'), 'venue', True),
+  (re.compile(r'^/api/v1/artists/(\d+)$'), 'artist', True),
+]
+
+
+class AsyncDatabase(object):
+  """
+  The asyncpg engines of the worker process, for the primary and the replica,
+  created on first use.
+  """
+
+  def __init__(self):
+    self.engines = {}
+
+  def engine(self, bind=None):
+    if bind not in self.engines:
+      uri = app.config['SQLALCHEMY_BINDS'][bind] if bind else app.config['SQLALCHEMY_DATABASE_URI']
+      url = make_url(uri).set(drivername='postgresql+asyncpg')
+      self.engines[bind] = create_async_engine(url, **async_engine_options(app.config))
+    return self.engines[bind]
+
+  async def fetch(self, bind, statement, all_rows):
+    """
+    Runs a statement in its own session, so that several can run at once.
+    """
+    async with AsyncSession(self.engine(bind)) as session:
+      result = await session.execute(statement)
+      return result.all() if all_rows else result.first()
+
+  async def dispose(self):
+    for engine in self.engines.values():
+      await engine.dispose()
+    self.engines = {}
+
+
+async_db = AsyncDatabase()
+
+
+def build_environ(scope):
+  """
+  Builds the WSGI environ of a request from its ASGI scope, without a body.
+  """
+  server = scope.get('server') or ('localhost', 80)
+  environ = {
+    'REQUEST_METHOD': scope['method'],
+    'SCRIPT_NAME': scope.get('root_path', ''),
+    'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+    'QUERY_STRING': scope['query_string'].decode('latin-1'),
+    'SERVER_NAME': server[0],
+    'SERVER_PORT': str(server[1]),
+    'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+    'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+    'wsgi.version': (1, 0),
+    'wsgi.url_scheme': scope.get('scheme', 'http'),
+    'wsgi.input': io.BytesIO(),
+    'wsgi.errors': sys.stderr,
+    'wsgi.multithread': False,
+    'wsgi.multiprocess': True,
+    'wsgi.run_once': False,
+  }
+  for name, value in scope['headers']:
+    name = name.decode('latin-1').upper().replace('-', '_')
+    if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+      name = 'HTTP_' + name
+    value = value.decode('latin-1')
+    environ[name] = f'{environ[name]},{value}' if name in environ else value
+  return environ
+
+
+def in_request(environ, func):
+  """
+  Calls func within a Flask request context. HTTP errors and the exceptions
+  with a registered handler are turned into responses, as in the Flask app.
+  """
+  with app.request_context(environ):
+    try:
+      return func()
+    except Exception as error:
+      return app.make_response(app.handle_user_exception(error))
+
+
+def finish(environ, response):
+  """
+  Runs the after_request hooks, which also save the session, on a response.
+  """
+  with app.request_context(environ):
+    return app.process_response(response)
+
+
+def plan_detail(page, entity_id, as_json):
+  """
+  Builds the statements of a detail page, to run concurrently.
+
+  Returns
+  -------
+  dict or Response
+    The plan: the statements to run, the bind to run them on and what the
+    rendering needs; or the response, if the request can be answered already.
+  """
+  early_response = app.preprocess_request()
+  if early_response is not None:
+    return app.make_response(early_response)
+
+  fields = page.resource.parse_fields(detail=True) if as_json else None
+  statements = {'validators': fyyur.detail_validators_query(page.model, entity_id).statement}
+  if as_json:
+    statements['entity'] = page.resource.query(fields).filter(page.model.id == entity_id).statement
+    if any(field in page.resource.nested_fields for field in fields):
+      show_key, other_model, other_key, _ = page.show_args
+      statements['shows'] = fyyur.shows_by_entity_query(show_key, entity_id, other_model, other_key).statement
+  return {
+    'statements': statements,
+    'bind': REPLICA_BIND if reads_from_replica() else None,
+    'fields': fields,
+    'cache_key': None,
+    'data': None,
+  }
+
+
+def plan_page_data(page, entity_id, plan, validators):
+  """
+  Looks an HTML detail page up in the page cache and, on a miss, replaces the
+  statements of the plan with those loading the data of the page.
+  """
+  plan['cache_key'], plan['data'] = page_cache.lookup(page.kind, entity_id, validators)
+  if plan['data'] is None:
+    show_key, other_model, other_key, _ = page.show_args
+    plan['statements'] = {
+      'entity': page.query(entity_id).statement,
+      'shows': fyyur.shows_by_entity_query(show_key, entity_id, other_model, other_key).statement,
+      'archive': fyyur.archive_summary_query(show_key, entity_id, other_model, other_key).statement,
+    }
+  else:
+    plan['statements'] = {}
+
+
+def render_detail(page, as_json, plan, results):
+  """
+  Answers a detail page request from the query results, as the Flask view
+  would.
+  """
+  validators, last_modified = fyyur.format_detail_validators(results['validators'])
+  prefix = page.show_args[3]
+
+  def render():
+    if results.get('entity') is None and plan['data'] is None:
+      fyyur.abort(404)
+    shows = fyyur.format_shows_by_entity(results['shows'], prefix) if 'shows' in results else None
+    if as_json:
+      entity_data = fyyur.format_api_entity(page.resource, results['entity'], plan['fields'], shows)
+      return api.json_response({"data": entity_data})
+    data = plan['data']
+    if data is None:
+      data = page.format(results['entity'], shows, fyyur.format_archive_summary(results['archive'], prefix))
+      page_cache.store(plan['cache_key'], data, expires_at=fyyur.find_next_show_time(data["upcoming_shows"]))
+    return render_template(page.template, **{page.kind: data})
+
+  return fyyur.conditional_response(validators, render, last_modified)
+
+
+async def fetch_all(plan):
+  """
+  Runs the statements of a plan concurrently, and returns their results by
+  name.
+  """
+  names = list(plan['statements'])
+  rows = await asyncio.gather(*[
+    async_db.fetch(plan['bind'], plan['statements'][name], all_rows=name in ('shows', 'archive')) for name in names
+  ])
+  return dict(zip(names, rows))
+
+
+async def serve_detail(scope, page, entity_id, as_json):
+  environ = build_environ(scope)
+  plan = in_request(environ, lambda: plan_detail(page, entity_id, as_json))
+  if isinstance(plan, Response):
+    return finish(environ, plan)
+
+  results = await fetch_all(plan)
+  validators, _ = fyyur.format_detail_validators(results['validators'])
+  if not as_json and validators is not None:
+    plan_page_data(page, entity_id, plan, validators)
+    results.update(await fetch_all(plan))
+  return finish(environ, in_request(environ, lambda: render_detail(page, as_json, plan, results)))
+
+
+async def send_response(send, response, head=False):
+  await send({
+    'type': 'http.response.start',
+    'status': response.status_code,
+    'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.headers.items()],
+  })
+  await send({'type': 'http.response.body', 'body': b'' if head else response.get_data()})
+
+
+async def lifespan(receive, send):
+  while True:
+    message = await receive()
+    if message['type'] == 'lifespan.startup':
+      await send({'type': 'lifespan.startup.complete'})
+    elif message['type'] == 'lifespan.shutdown':
+      await async_db.dispose()
+      await send({'type': 'lifespan.shutdown.complete'})
+      return
+
+
+wsgi_application = WsgiToAsgi(app)
+
+
+async def application(scope, receive, send):
+  if scope['type'] == 'lifespan':
+    return await lifespan(receive, send)
+  if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+    for pattern, kind, as_json in ROUTES:
+      match = pattern.match(scope['path'])
+      if match:
+        response = await serve_detail(scope, DETAIL_PAGES[kind], int(match.group(1)), as_json)
+        return await send_response(send, response, head=scope['method'] == 'HEAD')
+  return await wsgi_application(scope, receive, send)
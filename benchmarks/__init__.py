@@ -0,0 +1,9 @@
+"""
+Performance benchmarks for Fyyur.
+
+Each module in this package is a standalone script, run from the project root
+with ``python -m benchmarks.<module>``. Benchmarks that need a database read
+its URI from the FYYUR_BENCH_DATABASE_URI environment variable, and rebuild
+its schema from the migrations, so they should never be pointed at a database
+holding real data.
+"""
@@ -0,0 +1,109 @@
+"""
+Runs EXPLAIN on the queries behind the venue and artist detail pages and fails
+if any of them reads "Show" with a sequential scan.
+
+Sequential scans are disabled for the duration of each EXPLAIN, so the planner
+only falls back to one when no index can serve the query. This keeps the check
+meaningful on small development databases, where a sequential scan would
+otherwise be the cheapest plan.
+
+Usage:
+  python -m benchmarks.check_query_plans [--database-uri URI]
+"""
+import argparse
+import json
+import sys
+
+from sqlalchemy import event
+
+import app as fyyur
+from app import app, db
+from models import Venue, Artist, Show
+
+# The loaders whose SQL is checked, with the arguments they are called with.
+# Any entity id works since only the plans matter.
+PLAN_CHECKS = [
+  ('venue shows', fyyur.find_shows_by_entity, (Show.venue_id, 1, Artist, Show.artist_id, 'artist')),
+  ('artist shows', fyyur.find_shows_by_entity, (Show.artist_id, 1, Venue, Show.venue_id, 'venue')),
+]
+
+CHECKED_TABLE = 'Show'
+
+
+def capture_statements(engine, func, *args):
+  """
+  Calls func and returns the (statement, parameters) pairs it executed.
+  """
+  statements = []
+
+  def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    statements.append((statement, parameters))
+
+  event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+  try:
+    func(*args)
+  finally:
+    event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+  return statements
+
+
+def find_seq_scans(plan, table):
+  """
+  Walks an EXPLAIN (FORMAT JSON) plan tree and returns the sequential scan
+  nodes on the given table or its partitions, e.g. "Show_y2026m10".
+  """
+  seq_scans = []
+  relation = plan.get('Relation Name') or ''
+  if plan.get('Node Type') == 'Seq Scan' and (relation == table or relation.startswith(f'{table}_')):
+    seq_scans.append(plan)
+  for child in plan.get('Plans', []):
+    seq_scans.extend(find_seq_scans(child, table))
+  return seq_scans
+
+
+def explain(engine, statement, parameters):
+  """
+  Returns the root plan node of the statement, with sequential scans disabled.
+  """
+  connection = engine.raw_connection()
+  try:
+    cursor = connection.cursor()
+    cursor.execute('SET LOCAL enable_seqscan = off')
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+    plan = cursor.fetchone()[0]
+    connection.rollback()
+  finally:
+    connection.close()
+  if isinstance(plan, str):
+    plan = json.loads(plan)
+  return plan[0]['Plan']
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--database-uri', help='Defaults to SQLALCHEMY_DATABASE_URI from config.py.')
+  args = parser.parse_args(argv)
+  if args.database_uri:
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_uri
+
+  failures = 0
+  with app.app_context():
+    engine = db.get_engine()
+    for name, loader, loader_args in PLAN_CHECKS:
+      statements = capture_statements(engine, loader, *loader_args)
+      for statement, parameters in statements:
+        seq_scans = find_seq_scans(explain(engine, statement, parameters), CHECKED_TABLE)
+        if seq_scans:
+          failures += 1
+          print(f'FAIL {name}: sequential scan on "{CHECKED_TABLE}"')
+          print(statement)
+        else:
+          print(f'ok   {name}')
+    db.session.remove()
+
+  if failures:
+    sys.exit(f'{failures} queries fall back to a sequential scan on "{CHECKED_TABLE}".')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,68 @@
+"""
+Times the `datetime` Jinja filter over a large number of show start times,
+comparing the former parse-then-format path with the cached formatter, and
+checks that both produce the same strings. Needs no database.
+
+Usage:
+  python -m benchmarks.datetime_filter --shows 100000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from formatting import DATETIME_FORMATS, format_datetime, _format_datetime
+
+
+def format_datetime_reparsed(value, format='medium'):
+  """
+  The filter as it was: start times reached it as strings, which it parsed
+  back before handing them to Babel.
+  """
+  date = dateutil.parser.parse(value)
+  return babel.dates.format_datetime(date, DATETIME_FORMATS.get(format, format), locale='en')
+
+
+def make_start_times(count, seed=0):
+  """
+  Returns count show start times spread over two years, on the hour or half
+  hour like real listings, so that many shows share a start time.
+  """
+  rng = random.Random(seed)
+  start = datetime(2025, 1, 1, 18)
+  return [start + timedelta(minutes=30 * rng.randrange(2 * 24 * 730)) for _ in range(count)]
+
+
+def timed(func, values):
+  started = time.perf_counter()
+  results = [func(value) for value in values]
+  return results, time.perf_counter() - started
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument('--shows', type=int, default=100000)
+  args = parser.parse_args()
+
+  start_times = make_start_times(args.shows)
+  strings = [start_time.strftime('%Y-%m-%d %H:%M:%S') for start_time in start_times]
+
+  expected, reparsed = timed(lambda value: format_datetime_reparsed(value, 'full'), strings)
+  _format_datetime.cache_clear()
+  cold_results, cold = timed(lambda value: format_datetime(value, 'full'), start_times)
+  warm_results, warm = timed(lambda value: format_datetime(value, 'full'), start_times)
+
+  if cold_results != expected or warm_results != expected:
+    raise SystemExit('The cached formatter output differs from the former filter.')
+
+  print(f'{args.shows} shows, {len(set(start_times))} distinct start times')
+  print(f'{"parse + format":>16}: {reparsed:8.3f}s')
+  print(f'{"cached (cold)":>16}: {cold:8.3f}s  x{reparsed / cold:.1f}')
+  print(f'{"cached (warm)":>16}: {warm:8.3f}s  x{reparsed / warm:.1f}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,372 @@
+"""
+Bulk import of venues, artists and shows from CSV or NDJSON.
+
+Rows are validated with the rules of VenueForm, ArtistForm and ShowForm, then
+loaded with PostgreSQL COPY, IMPORT_BATCH_SIZE rows per transaction. Invalid
+rows are skipped and reported with their line number and field errors; the
+valid rows around them are still imported.
+
+In CSV files the first line names the fields, and multiple genres are given
+as a comma-separated list in one field. In NDJSON files every line is a JSON
+object, and genres are a list.
+
+COPY bypasses the ORM events, so the facet counts of imported venues and
+artists and the show counters of the venues and artists of imported shows are
+adjusted here, and Show.start_time_display is filled in when
+SHOW_DISPLAY_STRINGS is set.
+
+Imports are run with `flask import <entity> <file>` or by POSTing the file to
+/import/<entity> with the IMPORT_API_TOKEN bearer token.
+"""
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sys
+from collections import deque, namedtuple
+from itertools import islice
+
+import click
+from werkzeug.datastructures import MultiDict
+from wtforms import BooleanField, SelectMultipleField
+
+from forms import VenueForm, ArtistForm, ShowForm
+from formatting import format_datetime
+from facet_counts import FACETED_MODELS, adjust_facets_bulk
+from models import Venue, Artist, Show, app, db
+from show_counters import adjust_counters_bulk
+
+FORMATS = ('csv', 'ndjson')
+FALSE_VALUES = ('', '0', 'false', 'n', 'no', 'off')
+
+Entity = namedtuple('Entity', ['model', 'form', 'columns', 'required'])
+RowError = namedtuple('RowError', ['line', 'errors'])
+ImportResult = namedtuple('ImportResult', ['imported', 'errors', 'venue_ids', 'artist_ids'])
+
+ENTITIES = {
+  'venues': Entity(
+    Venue, VenueForm,
+    ['name', 'city', 'state', 'address', 'phone', 'genres', 'image_link', 'facebook_link',
+     'website_link', 'seeking_talent', 'seeking_description'],
+    required=[]
+  ),
+  'artists': Entity(
+    Artist, ArtistForm,
+    ['name', 'city', 'state', 'phone', 'genres', 'image_link', 'facebook_link',
+     'website_link', 'seeking_venue', 'seeking_description'],
+    required=[]
+  ),
+  # ShowForm does not validate the ids, and defaults the start time to the
+  # time the form module was loaded, so all three must be given explicitly.
+  'shows': Entity(
+    Show, ShowForm,
+    ['venue_id', 'artist_id', 'start_time'],
+    required=['venue_id', 'artist_id', 'start_time']
+  ),
+}
+
+
+class ImportInterrupted(Exception):
+  """
+  Raised when the stream cannot be read to the end, e.g. as it is not valid
+  UTF-8. The batches loaded before are committed, and reported in result.
+  """
+
+  def __init__(self, message, result):
+    super().__init__(message)
+    self.result = result
+
+
+def read_rows(stream, format):
+  """
+  Yields the (line, row) pairs of a CSV or NDJSON stream. row is a dict, or
+  None when the line could not be parsed.
+  """
+  if format == 'csv':
+    reader = csv.DictReader(stream)
+    for row in reader:
+      yield reader.line_num, row
+  else:
+    for line, text in enumerate(stream, 1):
+      if not text.strip():
+        continue
+      try:
+        row = json.loads(text)
+      except ValueError:
+        row = None
+      yield line, row if isinstance(row, dict) else None
+
+
+def to_formdata(form, row):
+  """
+  Converts a parsed row into the form data a browser would have posted for
+  it, and returns it with the errors of the fields the form does not have.
+  """
+  formdata = MultiDict()
+  errors = {}
+  for name, value in row.items():
+    if name is None:
+      # The cells of a CSV line beyond the fields of the header.
+      errors['_extra'] = ['More values than fields in the header.']
+      continue
+    field = form._fields.get(name)
+    if field is None:
+      errors[name] = ['Unknown field.']
+      continue
+    if value is None:
+      continue
+    if isinstance(field, BooleanField):
+      if str(value).strip().lower() not in FALSE_VALUES:
+        formdata.add(name, 'y')
+      continue
+    if isinstance(field, SelectMultipleField) and isinstance(value, str):
+      value = [item.strip() for item in value.split(',') if item.strip()]
+    for item in value if isinstance(value, list) else [value]:
+      formdata.add(name, str(item))
+  return formdata, errors
+
+
+def validate_row(entity, form, row):
+  """
+  Validates a row with the entity form.
+
+  Returns
+  -------
+  (dict, dict)
+    The column values of the row, and the errors of each invalid field. The
+    values are None when there are errors.
+  """
+  if row is None:
+    return None, {'row': ['Not a valid JSON object.']}
+  formdata, errors = to_formdata(form, row)
+  for name in entity.required:
+    if name not in formdata:
+      errors[name] = ['This field is required.']
+  form.process(formdata)
+  if not form.validate():
+    errors.update(form.errors)
+  values = {name: form[name].data for name in entity.columns}
+  if entity.model is Show and not errors:
+    for name in ('venue_id', 'artist_id'):
+      try:
+        values[name] = int(values[name])
+      except ValueError:
+        errors[name] = ['Not a valid integer value.']
+  return (None if errors else values), errors
+
+
+def copy_value(value):
+  """
+  Encodes a value in the text format of COPY.
+  """
+  if value is None:
+    return '\\N'
+  if isinstance(value, list):
+    value = '{' + ','.join('"' + item.replace('\\', '\\\\').replace('"', '\\"') + '"' for item in value) + '}'
+  return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_rows(connection, table, columns, rows):
+  """
+  Loads the rows, dicts of column values, into the table with COPY.
+  """
+  buffer = io.StringIO()
+  for row in rows:
+    buffer.write('\t'.join(copy_value(row[column]) for column in columns))
+    buffer.write('\n')
+  buffer.seek(0)
+  column_list = ', '.join(columns)
+  connection.connection.cursor().copy_expert(f'COPY "{table}" ({column_list}) FROM STDIN', buffer)
+
+
+def find_missing_ids(connection, model, ids):
+  """
+  Returns the given ids which do not exist in the model table.
+  """
+  existing = connection.execute(
+    db.select([model.id]).where(model.id.in_(ids))
+  ).fetchall()
+  return set(ids) - {row[0] for row in existing}
+
+
+def load_batch(entity, batch):
+  """
+  Loads a batch of validated (line, values) pairs in one transaction.
+
+  Shows whose venue or artist does not exist are left out, and returned as
+  row errors.
+  """
+  errors = []
+  with db.engine.begin() as connection:
+    if entity.model is Show:
+      missing_venues = find_missing_ids(connection, Venue, {values['venue_id'] for line, values in batch})
+      missing_artists = find_missing_ids(connection, Artist, {values['artist_id'] for line, values in batch})
+      valid = []
+      for line, values in batch:
+        row_errors = {}
+        if values['venue_id'] in missing_venues:
+          row_errors['venue_id'] = ['No venue with this id.']
+        if values['artist_id'] in missing_artists:
+          row_errors['artist_id'] = ['No artist with this id.']
+        if row_errors:
+          errors.append(RowError(line, row_errors))
+        else:
+          valid.append((line, values))
+      batch = valid
+
+    rows = [values for line, values in batch]
+    columns = list(entity.columns)
+    if entity.model is Show and app.config.get('SHOW_DISPLAY_STRINGS'):
+      columns.append('start_time_display')
+      for row in rows:
+        row['start_time_display'] = format_datetime(row['start_time'], 'full')
+    if rows:
+      copy_rows(connection, entity.model.__tablename__, columns, rows)
+      if entity.model is Show:
+        adjust_counters_bulk(connection, rows)
+      elif entity.model in FACETED_MODELS:
+        adjust_facets_bulk(connection, entity.model, rows)
+  return rows, errors
+
+
+def validate_chunk(entity_name, chunk):
+  """
+  Validates a list of (line, row) pairs with a fresh form of the entity.
+
+  Returns
+  -------
+  (list, list[RowError])
+    The (line, values) pairs of the valid rows, and the errors of the others.
+  """
+  entity = ENTITIES[entity_name]
+  valid, errors = [], []
+  with app.app_context():
+    form = entity.form(formdata=None, meta={'csrf': False})
+    for line, row in chunk:
+      values, row_errors = validate_row(entity, form, row)
+      if row_errors:
+        errors.append(RowError(line, row_errors))
+      else:
+        valid.append((line, values))
+  return valid, errors
+
+
+def validate_chunks(entity_name, chunks, workers):
+  """
+  Yields the validated chunks in order. With more than one worker, chunks
+  are validated in a pool of forked processes, at most two per worker ahead
+  of the one being loaded, so that validation overlaps with COPY and the
+  file is never read into memory as a whole.
+  """
+  if workers <= 1:
+    for chunk in chunks:
+      yield validate_chunk(entity_name, chunk)
+    return
+  pool = multiprocessing.get_context('fork').Pool(workers)
+  try:
+    pending = deque()
+    for chunk in chunks:
+      pending.append(pool.apply_async(validate_chunk, (entity_name, chunk)))
+      if len(pending) >= 2 * workers:
+        yield pending.popleft().get()
+    while pending:
+      yield pending.popleft().get()
+  finally:
+    pool.terminate()
+
+
+def import_rows(entity_name, stream, format, batch_size=None, workers=1):
+  """
+  Validates and imports the rows of a CSV or NDJSON stream.
+
+  Parameters
+  ----------
+  entity_name : str
+    'venues', 'artists' or 'shows'.
+  stream : file
+    The text stream to read.
+  format : str
+    'csv' or 'ndjson'.
+  batch_size : int, optional
+    The number of rows loaded per transaction, IMPORT_BATCH_SIZE by default.
+  workers : int
+    The number of processes validating rows. Validation with the forms is the
+    slowest step, so the CLI uses one per CPU.
+
+  Returns
+  -------
+  ImportResult
+    The number of imported rows, the errors of the rejected rows, and the ids
+    of the venues and artists whose shows changed.
+
+  Raises
+  ------
+  ImportInterrupted
+    If the stream is not valid UTF-8, with the result of the batches loaded
+    before.
+  """
+  entity = ENTITIES[entity_name]
+  batch_size = batch_size or app.config['IMPORT_BATCH_SIZE']
+  imported = 0
+  errors = []
+  venue_ids, artist_ids = set(), set()
+
+  rows = read_rows(stream, format)
+  chunks = iter(lambda: list(islice(rows, batch_size)), [])
+  try:
+    for batch, chunk_errors in validate_chunks(entity_name, chunks, workers):
+      errors.extend(chunk_errors)
+      if batch:
+        loaded, batch_errors = load_batch(entity, batch)
+        imported += len(loaded)
+        errors.extend(batch_errors)
+        if entity.model is Show:
+          venue_ids.update(row['venue_id'] for row in loaded)
+          artist_ids.update(row['artist_id'] for row in loaded)
+  except UnicodeDecodeError as error:
+    errors.sort(key=lambda row_error: row_error.line)
+    raise ImportInterrupted('The file is not valid UTF-8.', ImportResult(imported, errors, venue_ids, artist_ids)) from error
+  errors.sort(key=lambda error: error.line)
+  return ImportResult(imported, errors, venue_ids, artist_ids)
+
+
+def guess_format(filename):
+  """
+  Returns the format matching the extension of a file name, or None.
+  """
+  extension = os.path.splitext(filename)[1].lower().lstrip('.')
+  return {'csv': 'csv', 'ndjson': 'ndjson', 'jsonl': 'ndjson'}.get(extension)
+
+
+@app.cli.command('import')
+@click.argument('entity', type=click.Choice(list(ENTITIES)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option('--format', 'format', type=click.Choice(FORMATS), help='Defaults to the file extension.')
+@click.option('--batch-size', type=int, help='Rows per transaction, IMPORT_BATCH_SIZE by default.')
+@click.option('--workers', type=int, default=os.cpu_count() or 1, show_default=True, help='Processes validating rows.')
+def import_command(entity, path, format, batch_size, workers):
+  """Import venues, artists or shows from a CSV or NDJSON file."""
+  format = format or guess_format(path)
+  if format is None:
+    raise click.UsageError('Cannot tell the file format from its name, use --format.')
+  interrupted = None
+  # Opened with newline='' as the csv module expects, which click.open_file
+  # does not support.
+  if path == '-':
+    stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+  else:
+    stream = open(path, encoding='utf-8', newline='')
+  with stream:
+    try:
+      result = import_rows(entity, stream, format, batch_size, workers)
+    except ImportInterrupted as error:
+      interrupted, result = error, error.result
+  for error in result.errors:
+    for field, messages in error.errors.items():
+      click.echo(f'line {error.line}: {field}: {" ".join(messages)}', err=True)
+  click.echo(f'Imported {result.imported} {entity}, rejected {len(result.errors)} rows.')
+  if interrupted is not None:
+    click.echo(f'Stopped early: {interrupted}', err=True)
+  if result.errors or interrupted is not None:
+    sys.exit(1)
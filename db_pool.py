@@ -0,0 +1,181 @@
+"""
+Database connection pool settings and metrics.
+
+engine_options() turns the DB_POOL_* settings of config.py into the engine
+options of Flask-SQLAlchemy. The pool classes it selects record how long each
+checkout waits for a connection, how many checkouts time out, and how often
+the pool has to open overflow connections beyond DB_POOL_SIZE. pool_stats()
+reports them along with the current pool state.
+
+With DB_PGBOUNCER set, the application connects through PgBouncer in
+transaction pooling mode. Workers then keep no connections of their own:
+every checkout opens a connection to PgBouncer, which hands out server
+connections for the length of a transaction only, so nothing may rely on
+state kept on the server between transactions. The psycopg2 driver never
+prepares statements on the server, and the app's server-side cursors and row
+locks only live within a transaction. Drivers that cache prepared statements
+per connection, such as asyncpg, must have that cache disabled; see
+connect_args().
+
+Metrics are per worker process.
+"""
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import NullPool, QueuePool
+
+WAIT_BUCKETS = (0.001, 0.01, 0.1, 1.0)
+
+
+class PoolMetrics(object):
+  """
+  Checkout wait times and pool events of the worker process.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.reset()
+
+  def reset(self):
+    with self._lock:
+      self.checkouts = 0
+      self.timeouts = 0
+      self.overflows = 0
+      self.wait_total = 0.0
+      self.wait_max = 0.0
+      self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+
+  def record_checkout(self, wait):
+    with self._lock:
+      self.checkouts += 1
+      self.wait_total += wait
+      self.wait_max = max(self.wait_max, wait)
+      bucket = next((i for i, bound in enumerate(WAIT_BUCKETS) if wait <= bound), len(WAIT_BUCKETS))
+      self.wait_buckets[bucket] += 1
+
+  def record_timeout(self):
+    with self._lock:
+      self.timeouts += 1
+
+  def record_overflow(self):
+    with self._lock:
+      self.overflows += 1
+
+  def snapshot(self):
+    with self._lock:
+      labels = [f'<={bound * 1000:g}ms' for bound in WAIT_BUCKETS] + [f'>{WAIT_BUCKETS[-1] * 1000:g}ms']
+      return {
+        'checkouts': self.checkouts,
+        'timeouts': self.timeouts,
+        'overflows': self.overflows,
+        'wait_avg_ms': self.wait_total / self.checkouts * 1000 if self.checkouts else 0.0,
+        'wait_max_ms': self.wait_max * 1000,
+        'wait_histogram': dict(zip(labels, self.wait_buckets)),
+      }
+
+
+pool_metrics = PoolMetrics()
+_checkout = threading.local()
+
+
+class InstrumentedPool(object):
+  """
+  Mixin timing every checkout: the wait for a free connection, or the opening
+  of a new one.
+  """
+
+  def _do_get(self):
+    # QueuePool._do_get retries by calling itself; only time the outer call.
+    if getattr(_checkout, 'active', False):
+      return super(InstrumentedPool, self)._do_get()
+    _checkout.active = True
+    started = time.perf_counter()
+    try:
+      record = super(InstrumentedPool, self)._do_get()
+    except exc.TimeoutError:
+      pool_metrics.record_timeout()
+      raise
+    finally:
+      _checkout.active = False
+    pool_metrics.record_checkout(time.perf_counter() - started)
+    return record
+
+
+class InstrumentedQueuePool(InstrumentedPool, QueuePool):
+
+  def _inc_overflow(self):
+    opened = super(InstrumentedQueuePool, self)._inc_overflow()
+    if opened and self._overflow > 0:
+      pool_metrics.record_overflow()
+    return opened
+
+
+class InstrumentedNullPool(InstrumentedPool, NullPool):
+  pass
+
+
+def engine_options(config):
+  """
+  Builds the SQLALCHEMY_ENGINE_OPTIONS from the DB_POOL_* and DB_PGBOUNCER
+  settings.
+  """
+  if config.get('DB_PGBOUNCER'):
+    return {'poolclass': InstrumentedNullPool}
+  return {
+    'poolclass': InstrumentedQueuePool,
+    'pool_size': config['DB_POOL_SIZE'],
+    'max_overflow': config['DB_MAX_OVERFLOW'],
+    'pool_timeout': config['DB_POOL_TIMEOUT'],
+    'pool_recycle': config['DB_POOL_RECYCLE'],
+    'pool_pre_ping': config['DB_POOL_PRE_PING'],
+  }
+
+
+def async_engine_options(config):
+  """
+  Builds the options of the asyncpg engine of the ASGI entry point from the
+  same settings. Its pool is not instrumented.
+  """
+  options = {'connect_args': connect_args(config, 'asyncpg')}
+  if config.get('DB_PGBOUNCER'):
+    options['poolclass'] = NullPool
+  else:
+    options.update(
+      pool_size=config['DB_POOL_SIZE'],
+      max_overflow=config['DB_MAX_OVERFLOW'],
+      pool_timeout=config['DB_POOL_TIMEOUT'],
+      pool_recycle=config['DB_POOL_RECYCLE'],
+      pool_pre_ping=config['DB_POOL_PRE_PING'],
+    )
+  return options
+
+
+def connect_args(config, driver):
+  """
+  Returns the driver connect arguments needed in PgBouncer mode: drivers
+  caching prepared statements per connection must not, since consecutive
+  transactions may run on different server connections.
+  """
+  if config.get('DB_PGBOUNCER') and driver == 'asyncpg':
+    return {'statement_cache_size': 0, 'prepared_statement_cache_size': 0}
+  return {}
+
+
+def pool_stats(engine):
+  """
+  Reports the pool settings and state, and the metrics of the worker process.
+  """
+  pool = engine.pool
+  stats = {'pool': type(pool).__name__}
+  if isinstance(pool, QueuePool):
+    stats.update(
+      size=pool.size(),
+      checked_in=pool.checkedin(),
+      checked_out=pool.checkedout(),
+      overflow=max(0, pool.overflow()),
+      max_overflow=pool._max_overflow,
+      timeout=pool.timeout(),
+    )
+  stats.update(pool_metrics.snapshot())
+  return stats
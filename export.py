@@ -0,0 +1,148 @@
+"""
+Streaming export of the Venue, Artist and Show tables as NDJSON or CSV.
+
+Rows are read from a server-side cursor STREAM_BATCH_SIZE at a time, on the
+read replica when one is configured. They are encoded and handed on batch by
+batch, optionally gzip-compressed, so memory use stays flat regardless of the
+table size. Every column of the table is exported, in id order. With
+`since`, only the rows whose updated_at is at or after the given time are
+exported; deleted rows are not reported.
+
+In CSV files, genres are written as one comma-separated field, as
+bulk_import reads them.
+
+Exports are run with `flask export <entity>` or downloaded from
+/export/<entity>.<format>, e.g. /export/shows.csv.gz?since=2026-10-16T00:00:00,
+with the EXPORT_API_TOKEN bearer token.
+"""
+import csv
+import io
+import zlib
+
+import click
+
+from api import dumps
+from models import Venue, Artist, Show, app, db
+
+EXPORT_TABLES = {'venues': Venue, 'artists': Artist, 'shows': Show}
+FORMATS = ('ndjson', 'csv')
+CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def parse_format(name):
+  """
+  Splits an export file extension such as 'csv.gz' into the format and
+  whether it is gzip-compressed.
+
+  Returns
+  -------
+  (str, bool)
+    The format, or None if it is not supported, and the compression flag.
+  """
+  compress = name.endswith('.gz')
+  format = name[:-len('.gz')] if compress else name
+  return (format if format in FORMATS else None), compress
+
+
+def iter_batches(model, since=None, batch_size=None, replica=False):
+  """
+  Yields the rows of the model table, in id order, batch_size at a time,
+  from a server-side cursor on the replica if replica is set, else on the
+  primary.
+  """
+  table = model.__table__
+  query = db.select(list(table.columns)).order_by(table.c.id)
+  if since is not None:
+    query = query.where(table.c.updated_at >= since)
+  batch_size = batch_size or app.config['STREAM_BATCH_SIZE']
+  engine = db.replica_engine() if replica else db.engine
+  with engine.connect() as connection:
+    result = connection.execution_options(stream_results=True).execute(query)
+    while True:
+      rows = result.fetchmany(batch_size)
+      if not rows:
+        break
+      yield rows
+
+
+def encode_ndjson(columns, rows):
+  return b''.join(dumps(dict(zip(columns, row))) + b'\n' for row in rows)
+
+
+def csv_value(value):
+  if isinstance(value, list):
+    return ','.join(value)
+  return value
+
+
+def encode_csv(columns, rows):
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  writer.writerows([csv_value(value) for value in row] for row in rows)
+  return buffer.getvalue().encode()
+
+
+def gzip_chunks(chunks):
+  """
+  Compresses a stream of byte chunks into a gzip stream.
+  """
+  compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+  for chunk in chunks:
+    compressed = compressor.compress(chunk)
+    if compressed:
+      yield compressed
+  yield compressor.flush()
+
+
+def iter_export(entity, format, since=None, compress=False, replica=False):
+  """
+  Yields the export of a table as byte chunks, one per batch of rows.
+
+  Parameters
+  ----------
+  entity : str
+    'venues', 'artists' or 'shows'.
+  format : str
+    'ndjson' or 'csv'.
+  since : datetime, optional
+    Only export the rows updated at or after this time.
+  compress : bool
+    Whether to gzip the output.
+  replica : bool
+    Whether to read from the read replica, if one is configured. Exports
+    given since should not, as rows the replica has yet to receive would be
+    missing from them for good.
+
+  Yields
+  ------
+  bytes
+    The next chunk of the export.
+  """
+  model = EXPORT_TABLES[entity]
+  columns = [column.name for column in model.__table__.columns]
+
+  def chunks():
+    if format == 'csv':
+      yield encode_csv(columns, [columns])
+    encode = encode_csv if format == 'csv' else encode_ndjson
+    for rows in iter_batches(model, since, replica=replica):
+      yield encode(columns, rows)
+
+  return gzip_chunks(chunks()) if compress else chunks()
+
+
+@app.cli.command('export')
+@click.argument('entity', type=click.Choice(list(EXPORT_TABLES)))
+@click.option('--format', 'format', type=click.Choice(FORMATS), help='Defaults to the output file extension, or ndjson.')
+@click.option('--output', '-o', default='-', help='The output file, standard output by default.')
+@click.option('--gzip', 'compress', is_flag=True, help='Compress the output. Implied by a .gz output file.')
+@click.option('--since', type=click.DateTime(['%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d']),
+              help='Only export the rows updated at or after this time.')
+def export_command(entity, format, output, compress, since):
+  """Export venues, artists or shows as NDJSON or CSV."""
+  extension_format, extension_compress = parse_format(output.rsplit('/', 1)[-1].split('.', 1)[-1])
+  format = format or extension_format or 'ndjson'
+  compress = compress or extension_compress
+  with click.open_file(output, 'wb') as stream:
+    for chunk in iter_export(entity, format, since, compress, replica=since is None):
+      stream.write(chunk)
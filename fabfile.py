@@ -1,15 +1,26 @@
+import os
+
 from fabric.api import local, settings, abort
 from fabric.contrib.console import confirm
 
+BENCHMARK_BASELINE = "benchmarks/baseline.json"
+
 # prepare for deployment
 
 
 def test():
+    # Baselines are machine-specific, so none is committed: the first run on
+    # a machine records one, and later runs are checked against it.
+    if os.path.exists(BENCHMARK_BASELINE):
+        options = "--baseline {}".format(BENCHMARK_BASELINE)
+    else:
+        options = "--output {}".format(BENCHMARK_BASELINE)
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python -m benchmarks.suite --sizes small {}".format(options),
+            capture=True
         )
-    if result.failed and not confirm("Tests failed. Continue?"):
+    if result.failed and not confirm("Benchmarks failed or regressed. Continue?"):
         abort("Aborted at user request.")
 
 
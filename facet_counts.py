@@ -0,0 +1,198 @@
+"""
+Precomputed facet counts of the venue and artist listings.
+
+FacetCount holds the number of venues and of artists with each genre, in
+each state and in each city, e.g. "Jazz (412) · CA (1,203) · San Francisco,
+CA (87)". Every count exists in several scopes: overall, with the empty
+scope, and among the venues or artists of each genre, with that genre as
+scope. A listing page reads all the counts of its scope with a single lookup
+on the primary key of FacetCount, instead of unnesting and grouping the
+genres of every row on each view.
+
+* Inserting, updating or deleting a Venue or an Artist through the ORM
+  adjusts the counts in the same transaction. Bulk loads that bypass the ORM
+  call adjust_facets_bulk instead.
+* `flask recount-facets` recomputes every count from the Venue and Artist
+  tables and reports the ones that had drifted, e.g. after rows were written
+  with raw SQL. With --check it only reports.
+
+Counts that drop to zero are kept, and left out when read.
+"""
+import sys
+from collections import Counter
+
+import click
+from sqlalchemy import event, text
+
+from models import Venue, Artist, app, db
+
+FACETED_MODELS = {Venue: 'venue', Artist: 'artist'}
+FACET_COLUMNS = ['genres', 'state', 'city']
+OVERALL = ''
+
+# The (scope, facet, value) triples counted for each row of a table, as
+# facet_contributions computes them.
+CONTRIBUTIONS = '''
+  SELECT s.scope, f.facet, f.value
+  FROM "{table}" AS t
+  CROSS JOIN LATERAL (
+    SELECT ARRAY(SELECT DISTINCT genre FROM unnest(t.genres) AS g (genre) WHERE genre <> '') AS genres
+  ) AS n
+  CROSS JOIN LATERAL (SELECT '' UNION ALL SELECT unnest(n.genres)) AS s (scope)
+  CROSS JOIN LATERAL (
+    SELECT 'genre', unnest(n.genres)
+    UNION ALL SELECT 'state', nullif(t.state, '')
+    UNION ALL SELECT 'city', nullif(concat_ws(', ', nullif(t.city, ''), nullif(t.state, '')), '')
+  ) AS f (facet, value)
+  WHERE f.value IS NOT NULL
+'''
+
+
+def facet_contributions(genres, state, city):
+  """
+  Lists the (scope, facet, value) triples a venue or an artist counts in:
+  each of its genres, its state and its city, overall and within the scope
+  of each of its genres.
+  """
+  genres = [genre for genre in dict.fromkeys(genres or []) if genre]
+  values = [('genre', genre) for genre in genres]
+  if state:
+    values.append(('state', state))
+  city = ', '.join(part for part in (city, state) if part)
+  if city:
+    values.append(('city', city))
+  return [(scope, facet, value) for scope in [OVERALL] + genres for facet, value in values]
+
+
+def adjust_facets(connection, entity, deltas):
+  """
+  Adds deltas to the facet counts of an entity.
+
+  Parameters
+  ----------
+  connection : sqlalchemy.engine.Connection
+    The connection the rows were written with.
+  entity : str
+    'venue' or 'artist'.
+  deltas : Counter
+    The change of each (scope, facet, value) count.
+  """
+  # Sorted, so that concurrent adjustments lock the rows they share in the
+  # same order and cannot deadlock.
+  rows = [
+    {'entity': entity, 'scope': scope, 'facet': facet, 'value': value, 'delta': delta}
+    for (scope, facet, value), delta in sorted(deltas.items()) if delta
+  ]
+  if rows:
+    connection.execute(text('''
+      INSERT INTO "FacetCount" AS c (entity, scope, facet, value, count)
+      VALUES (:entity, :scope, :facet, :value, :delta)
+      ON CONFLICT (entity, scope, facet, value) DO UPDATE SET count = c.count + excluded.count
+    '''), rows)
+
+
+def adjust_facets_bulk(connection, model, rows):
+  """
+  Adds venues or artists inserted without going through the ORM, e.g. with
+  COPY, to the facet counts, in the same transaction.
+
+  Parameters
+  ----------
+  connection : sqlalchemy.engine.Connection
+    The connection the rows were inserted with.
+  model : Venue or Artist
+    The model of the rows.
+  rows : list[dict]
+    The genres, state and city of each row.
+  """
+  deltas = Counter()
+  for row in rows:
+    deltas.update(facet_contributions(row.get('genres'), row.get('state'), row.get('city')))
+  adjust_facets(connection, FACETED_MODELS[model], deltas)
+
+
+def count_inserted(mapper, connection, target):
+  deltas = Counter(facet_contributions(target.genres, target.state, target.city))
+  adjust_facets(connection, FACETED_MODELS[mapper.class_], deltas)
+
+
+def count_updated(mapper, connection, target):
+  # Runs before the UPDATE, so the row still holds the previous values.
+  attributes = db.inspect(target).attrs
+  if not any(attributes[column].history.has_changes() for column in FACET_COLUMNS):
+    return
+  table = mapper.class_.__tablename__
+  previous = connection.execute(
+    text(f'SELECT genres, state, city FROM "{table}" WHERE id = :id'), {'id': target.id}
+  ).first()
+  deltas = Counter(facet_contributions(target.genres, target.state, target.city))
+  if previous is not None:
+    deltas.subtract(facet_contributions(*previous))
+  adjust_facets(connection, FACETED_MODELS[mapper.class_], deltas)
+
+
+def count_deleted(mapper, connection, target):
+  deltas = Counter()
+  deltas.subtract(facet_contributions(target.genres, target.state, target.city))
+  adjust_facets(connection, FACETED_MODELS[mapper.class_], deltas)
+
+
+for model in FACETED_MODELS:
+  event.listen(model, 'after_insert', count_inserted)
+  event.listen(model, 'before_update', count_updated)
+  event.listen(model, 'after_delete', count_deleted)
+
+
+def recount_facets(fix=True):
+  """
+  Recomputes every facet count from the Venue and Artist tables.
+
+  Parameters
+  ----------
+  fix : bool
+    Whether to overwrite the counts that drifted, or only report them.
+
+  Returns
+  -------
+  list[tuple]
+    The (entity, scope, facet, value, stored, actual) rows of the counts
+    that had drifted.
+  """
+  drifted = []
+  with db.engine.begin() as connection:
+    # Blocks concurrent adjustments until the recount is committed, so that
+    # none is lost or counted twice.
+    connection.execute(text('LOCK TABLE "FacetCount" IN SHARE ROW EXCLUSIVE MODE'))
+    for model, entity in FACETED_MODELS.items():
+      actual = f'''
+        SELECT scope, facet, value, count(*) AS count
+        FROM ({CONTRIBUTIONS.format(table=model.__tablename__)}) AS contributions
+        GROUP BY scope, facet, value
+      '''
+      rows = connection.execute(text(f'''
+        SELECT :entity, scope, facet, value, coalesce(s.count, 0), coalesce(a.count, 0)
+        FROM (SELECT scope, facet, value, count FROM "FacetCount" WHERE entity = :entity) AS s
+        FULL JOIN ({actual}) AS a USING (scope, facet, value)
+        WHERE coalesce(s.count, 0) <> coalesce(a.count, 0)
+        ORDER BY 2, 3, 4
+      '''), {'entity': entity}).fetchall()
+      drifted.extend(tuple(row) for row in rows)
+      if fix and rows:
+        connection.execute(text('DELETE FROM "FacetCount" WHERE entity = :entity'), {'entity': entity})
+        connection.execute(text(f'''
+          INSERT INTO "FacetCount" (entity, scope, facet, value, count)
+          SELECT :entity, scope, facet, value, count FROM ({actual}) AS a
+        '''), {'entity': entity})
+  return drifted
+
+
+@app.cli.command('recount-facets')
+@click.option('--check', is_flag=True, help='Only report drifted counts, and exit with status 1 if any.')
+def recount_facets_command(check):
+  """Recompute the genre, state and city facet counts from scratch."""
+  drifted = recount_facets(fix=not check)
+  for entity, scope, facet, value, stored, actual in drifted:
+    click.echo(f'{entity} {facet} {value!r} in {scope or "all"}: {stored} -> {actual}')
+  click.echo(f'{len(drifted)} drifted counts {"found" if check else "fixed"}.')
+  if check and drifted:
+    sys.exit(1)
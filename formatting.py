@@ -0,0 +1,88 @@
+"""
+Date and time formatting for the templates.
+
+format_datetime() backs the `datetime` Jinja filter. It takes native
+datetimes, so the data layer no longer needs to turn them into strings for
+the filter to parse back. The Babel pattern and locale for each
+(format, locale) pair are resolved once, and formatted strings are memoized,
+since show-heavy pages format the same start times over and over.
+
+Optionally (SHOW_DISPLAY_STRINGS in config.py), the 'full' rendering of each
+show's start time is also stored in Show.start_time_display when the show is
+written, and the templates print it as is. `flask backfill-show-display`
+fills it in for existing shows.
+"""
+from datetime import datetime
+from functools import lru_cache
+
+import click
+import dateutil.parser
+from babel.core import Locale
+from babel.dates import parse_pattern
+from sqlalchemy import event
+
+from models import Show, app, db
+
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=None)
+def compile_format(format, locale):
+  """
+  Returns the compiled Babel pattern and the parsed locale for a format name
+  or a raw Babel pattern.
+  """
+  return parse_pattern(DATETIME_FORMATS.get(format, format)), Locale.parse(locale)
+
+
+@lru_cache(maxsize=65536)
+def _format_datetime(value, format, locale):
+  pattern, parsed_locale = compile_format(format, locale)
+  return pattern.apply(value, parsed_locale)
+
+
+def format_datetime(value, format='medium', locale='en'):
+  """
+  Formats a datetime with a named format ('full' or 'medium') or a Babel
+  pattern. Strings are parsed first, for callers still passing them.
+  """
+  if isinstance(value, str):
+    value = dateutil.parser.parse(value)
+  return _format_datetime(value, format, locale)
+
+
+@event.listens_for(Show, 'before_insert')
+@event.listens_for(Show, 'before_update')
+def set_start_time_display(mapper, connection, show):
+  if app.config.get('SHOW_DISPLAY_STRINGS') and show.start_time is not None:
+    start_time = show.start_time
+    if isinstance(start_time, str):
+      start_time = dateutil.parser.parse(start_time)
+    show.start_time_display = format_datetime(start_time, 'full')
+
+
+@app.cli.command('backfill-show-display')
+@click.option('--batch-size', default=5000, show_default=True)
+@click.option('--all', 'refresh_all', is_flag=True, help='Also rewrite strings already set, e.g. after a format change.')
+def backfill_show_display_command(batch_size, refresh_all):
+  """Fill in Show.start_time_display for existing shows."""
+  last_id = 0
+  updated = 0
+  while True:
+    query = db.session.query(Show.id, Show.start_time).filter(Show.id > last_id)
+    if not refresh_all:
+      query = query.filter(Show.start_time_display.is_(None))
+    rows = query.order_by(Show.id).limit(batch_size).all()
+    if not rows:
+      break
+    db.session.bulk_update_mappings(Show, [
+      {'id': id, 'start_time_display': format_datetime(start_time, 'full')}
+      for id, start_time in rows
+    ])
+    db.session.commit()
+    last_id = rows[-1][0]
+    updated += len(rows)
+  click.echo(f'Updated {updated} shows.')
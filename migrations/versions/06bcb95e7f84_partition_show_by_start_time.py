@@ -0,0 +1,112 @@
+"""partition Show by month of start_time
+
+Revision ID: 06bcb95e7f84
+Revises: f1c83e5a7d20
+Create Date: 2026-10-17 18:52:07.334581
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '06bcb95e7f84'
+down_revision = 'f1c83e5a7d20'
+branch_labels = None
+depends_on = None
+
+# Partitions are created from the month of the earliest show up to this many
+# months ahead; `flask partition-shows` keeps creating them from then on.
+MONTHS_AHEAD = 12
+
+COLUMNS = 'id, artist_id, venue_id, start_time, start_time_display, updated_at'
+
+INDEXES = [
+    ('ix_show_venue_id_start_time', ['venue_id', 'start_time']),
+    ('ix_show_artist_id_start_time', ['artist_id', 'start_time']),
+    ('ix_show_start_time_id', ['start_time', 'id']),
+    ('ix_show_updated_at', ['updated_at']),
+]
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def create_show_table(name, partitioned):
+    # The primary key of a partitioned table must include the partition key.
+    op.execute(f'''
+        CREATE TABLE "{name}" (
+            id integer NOT NULL,
+            artist_id integer NOT NULL,
+            venue_id integer NOT NULL,
+            start_time timestamp without time zone NOT NULL,
+            start_time_display varchar(120),
+            updated_at timestamp without time zone NOT NULL DEFAULT now(),
+            CONSTRAINT "Show_artist_id_fkey" FOREIGN KEY (artist_id) REFERENCES "Artist" (id),
+            CONSTRAINT "Show_venue_id_fkey" FOREIGN KEY (venue_id) REFERENCES "Venue" (id)
+        ) {'PARTITION BY RANGE (start_time)' if partitioned else ''}
+    ''')
+
+
+def replace_show_table(name, primary_key):
+    """
+    Swaps the table built alongside "Show" in for it, keeping the id sequence,
+    then adds the keys, indexes and triggers of "Show".
+    """
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+    op.execute('DROP TABLE "Show"')
+    op.execute(f'ALTER TABLE "{name}" RENAME TO "Show"')
+    op.execute('''ALTER TABLE "Show" ALTER COLUMN id SET DEFAULT nextval('"Show_id_seq"'::regclass)''')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    op.execute(f'ALTER TABLE "Show" ADD CONSTRAINT "Show_pkey" PRIMARY KEY ({primary_key})')
+    for index, columns in INDEXES:
+        op.create_index(index, 'Show', columns, unique=False)
+    op.execute('''
+        CREATE TRIGGER "Show_set_updated_at" BEFORE UPDATE ON "Show"
+        FOR EACH ROW EXECUTE PROCEDURE set_updated_at()
+    ''')
+    op.execute('''
+        CREATE TRIGGER "Show_bump_table_version" AFTER INSERT OR UPDATE OR DELETE ON "Show"
+        FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version()
+    ''')
+    op.execute('ANALYZE "Show"')
+
+
+def upgrade():
+    connection = op.get_bind()
+    # Row-level triggers on partitioned tables, needed for updated_at.
+    if int(connection.execute(sa.text('SHOW server_version_num')).scalar()) < 130000:
+        raise RuntimeError('Partitioning "Show" requires PostgreSQL 13 or later.')
+
+    # Writes to "Show" are blocked until the rows have been copied over.
+    op.execute('LOCK TABLE "Show" IN ACCESS EXCLUSIVE MODE')
+    create_show_table('Show_partitioned', partitioned=True)
+
+    first_show = connection.execute(sa.text('SELECT min(start_time) FROM "Show"')).scalar()
+    month = date.today().replace(day=1)
+    if first_show is not None:
+        month = min(month, first_show.date().replace(day=1))
+    last_month = add_months(date.today().replace(day=1), MONTHS_AHEAD)
+    while month <= last_month:
+        op.execute(f'''
+            CREATE TABLE "Show_y{month.year}m{month.month:02d}" PARTITION OF "Show_partitioned"
+            FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')
+        ''')
+        month = add_months(month, 1)
+    # Shows beyond the last partition, until partitions are created for them.
+    op.execute('CREATE TABLE "Show_default" PARTITION OF "Show_partitioned" DEFAULT')
+
+    op.execute(f'INSERT INTO "Show_partitioned" ({COLUMNS}) SELECT {COLUMNS} FROM "Show"')
+    replace_show_table('Show_partitioned', 'id, start_time')
+
+
+def downgrade():
+    # Partitions detached by `flask partition-shows` are left as they are.
+    op.execute('LOCK TABLE "Show" IN ACCESS EXCLUSIVE MODE')
+    create_show_table('Show_unpartitioned', partitioned=False)
+    op.execute(f'INSERT INTO "Show_unpartitioned" ({COLUMNS}) SELECT {COLUMNS} FROM "Show"')
+    replace_show_table('Show_unpartitioned', 'id')
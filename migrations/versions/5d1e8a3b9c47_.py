@@ -0,0 +1,30 @@
+"""add composite indexes on Show for venue and artist time-range filters
+
+Revision ID: 5d1e8a3b9c47
+Revises: c730af01aeed
+Create Date: 2026-10-17 09:12:44.218305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1e8a3b9c47'
+down_revision = 'c730af01aeed'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block, and
+    # does not take a lock that blocks writes to "Show" while it builds.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_show_artist_id_start_time', table_name='Show', postgresql_concurrently=True)
+        op.drop_index('ix_show_venue_id_start_time', table_name='Show', postgresql_concurrently=True)
@@ -0,0 +1,31 @@
+"""enable pg_trgm and add trigram indexes on Venue and Artist names
+
+Revision ID: 8f2c61d4e0ab
+Revises: 5d1e8a3b9c47
+Create Date: 2026-10-17 10:03:27.551092
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f2c61d4e0ab'
+down_revision = '5d1e8a3b9c47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    with op.get_context().autocommit_block():
+        op.create_index('ix_venue_name_trgm', 'Venue', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}, postgresql_concurrently=True)
+        op.create_index('ix_artist_name_trgm', 'Artist', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}, postgresql_concurrently=True)
+
+
+def downgrade():
+    # The pg_trgm extension is left installed, as other objects in the
+    # database may depend on it.
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_artist_name_trgm', table_name='Artist', postgresql_concurrently=True)
+        op.drop_index('ix_venue_name_trgm', table_name='Venue', postgresql_concurrently=True)
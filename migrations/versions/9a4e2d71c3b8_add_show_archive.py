@@ -0,0 +1,60 @@
+"""add ShowArchive and ShowArchiveSummary
+
+Revision ID: 9a4e2d71c3b8
+Revises: 06bcb95e7f84
+Create Date: 2026-10-17 20:14:36.508127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4e2d71c3b8'
+down_revision = '06bcb95e7f84'
+branch_labels = None
+depends_on = None
+
+COLUMNS = 'id, artist_id, venue_id, start_time, start_time_display, updated_at'
+
+
+def upgrade():
+    # The partitions of Show are attached to ShowArchive as they are archived,
+    # so it has the same columns, partition key and primary key.
+    op.create_table('ShowArchive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('start_time_display', sa.String(length=120), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ),
+    sa.PrimaryKeyConstraint('id', 'start_time'),
+    postgresql_partition_by='RANGE (start_time)'
+    )
+    op.create_index('ix_show_archive_venue_id_start_time', 'ShowArchive', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_show_archive_artist_id_start_time', 'ShowArchive', ['artist_id', 'start_time'], unique=False)
+
+    op.create_table('ShowArchiveSummary',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('shows_count', sa.Integer(), nullable=False),
+    sa.Column('first_start_time', sa.DateTime(), nullable=False),
+    sa.Column('last_start_time', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ),
+    sa.PrimaryKeyConstraint('venue_id', 'artist_id')
+    )
+    op.create_index('ix_show_archive_summary_artist_id', 'ShowArchiveSummary', ['artist_id'], unique=False)
+
+
+def downgrade():
+    # Archived shows go back to Show, in the default partition for the months
+    # whose partitions were archived.
+    op.execute(f'INSERT INTO "Show" ({COLUMNS}) SELECT {COLUMNS} FROM "ShowArchive"')
+    op.drop_index('ix_show_archive_summary_artist_id', table_name='ShowArchiveSummary')
+    op.drop_table('ShowArchiveSummary')
+    op.drop_index('ix_show_archive_artist_id_start_time', table_name='ShowArchive')
+    op.drop_index('ix_show_archive_venue_id_start_time', table_name='ShowArchive')
+    op.drop_table('ShowArchive')
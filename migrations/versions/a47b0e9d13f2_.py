@@ -0,0 +1,26 @@
+"""add an index on Show start_time and id for keyset pagination
+
+Revision ID: a47b0e9d13f2
+Revises: 8f2c61d4e0ab
+Create Date: 2026-10-17 11:26:05.904417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a47b0e9d13f2'
+down_revision = '8f2c61d4e0ab'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_show_start_time_id', 'Show', ['start_time', 'id'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_show_start_time_id', table_name='Show', postgresql_concurrently=True)
@@ -0,0 +1,55 @@
+"""add materialized upcoming and past show counters
+
+Revision ID: b9d04f6e2c18
+Revises: e3a9c5f7b210
+Create Date: 2026-10-17 15:02:51.370948
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9d04f6e2c18'
+down_revision = 'e3a9c5f7b210'
+branch_labels = None
+depends_on = None
+
+COUNTED_TABLES = [('Venue', 'venue_id'), ('Artist', 'artist_id')]
+
+
+def upgrade():
+    op.create_table('ShowCounterState',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_over_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # The watermark is compared with datetime.now() of the app, so the app
+    # clock is used rather than the now() of the database session, whose time
+    # zone may differ.
+    now = datetime.now()
+    op.execute(sa.text('INSERT INTO "ShowCounterState" (id, rolled_over_at) VALUES (1, :now)').bindparams(now=now))
+    for table, key in COUNTED_TABLES:
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.execute(sa.text(f'''
+            UPDATE "{table}" AS t
+            SET upcoming_shows_count = c.upcoming, past_shows_count = c.past
+            FROM (
+                SELECT {key} AS id,
+                       count(*) FILTER (WHERE start_time > :now) AS upcoming,
+                       count(*) FILTER (WHERE start_time <= :now) AS past
+                FROM "Show"
+                GROUP BY {key}
+            ) AS c
+            WHERE t.id = c.id
+        ''').bindparams(now=now))
+
+
+def downgrade():
+    for table, key in COUNTED_TABLES:
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
+    op.drop_table('ShowCounterState')
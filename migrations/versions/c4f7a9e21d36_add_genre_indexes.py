@@ -0,0 +1,76 @@
+"""make Artist genres an array, normalize genres and add GIN indexes
+
+Revision ID: c4f7a9e21d36
+Revises: 9a4e2d71c3b8
+Create Date: 2026-10-17 21:02:45.190836
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f7a9e21d36'
+down_revision = '9a4e2d71c3b8'
+branch_labels = None
+depends_on = None
+
+# The genre choices of forms.py when this revision was written.
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop', 'Heavy Metal',
+    'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul', 'Other',
+]
+
+TABLES = [('Venue', 'ix_venue_genres'), ('Artist', 'ix_artist_genres')]
+
+
+def artist_genres_to_array():
+    # Artist genres were left a varchar by 2066d6864ca7, into which the list
+    # of the form is stored as an array literal, e.g. '{Jazz,"Rock n Roll"}'.
+    # Anything else is taken as comma separated genres.
+    op.execute('''
+        ALTER TABLE "Artist" ALTER COLUMN genres TYPE varchar(120)[] USING CASE
+            WHEN genres LIKE '{%}' THEN genres::varchar(120)[]
+            ELSE string_to_array(genres, ',')::varchar(120)[]
+        END
+    ''')
+
+
+def normalize_genres(table):
+    # Same rules as forms.normalize_genres: choices spelled as in the form
+    # whatever their case and surrounding whitespace, duplicates and empty
+    # values dropped, first occurrence order kept.
+    choices = ', '.join("('{}')".format(genre.replace("'", "''")) for genre in GENRES)
+    op.execute(f'''
+        UPDATE "{table}" AS t SET genres = n.genres
+        FROM (
+            SELECT id, ARRAY(
+                SELECT coalesce(c.genre, trim(g.genre))
+                FROM unnest(genres) WITH ORDINALITY AS g (genre, position)
+                LEFT JOIN (VALUES {choices}) AS c (genre) ON lower(c.genre) = lower(trim(g.genre))
+                WHERE trim(g.genre) <> ''
+                GROUP BY 1
+                ORDER BY min(g.position)
+            )::varchar(120)[] AS genres
+            FROM "{table}"
+            WHERE genres IS NOT NULL
+        ) AS n
+        WHERE t.id = n.id AND t.genres IS DISTINCT FROM n.genres
+    ''')
+
+
+def upgrade():
+    artist_genres_to_array()
+    for table, index in TABLES:
+        normalize_genres(table)
+    with op.get_context().autocommit_block():
+        for table, index in TABLES:
+            op.create_index(index, table, ['genres'], unique=False, postgresql_using='gin', postgresql_concurrently=True)
+
+
+def downgrade():
+    # Normalized genres are left as they are.
+    with op.get_context().autocommit_block():
+        for table, index in reversed(TABLES):
+            op.drop_index(index, table_name=table, postgresql_concurrently=True)
+    op.execute('ALTER TABLE "Artist" ALTER COLUMN genres TYPE varchar(120) USING genres::varchar(120)')
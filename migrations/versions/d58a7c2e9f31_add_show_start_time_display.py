@@ -0,0 +1,24 @@
+"""add pre-rendered show start time
+
+Revision ID: d58a7c2e9f31
+Revises: b9d04f6e2c18
+Create Date: 2026-10-17 16:11:08.204517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd58a7c2e9f31'
+down_revision = 'b9d04f6e2c18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('start_time_display', sa.String(length=120), nullable=True))
+
+
+def downgrade():
+    op.drop_column('Show', 'start_time_display')
@@ -0,0 +1,69 @@
+"""add updated_at columns and table change tracking
+
+Revision ID: e3a9c5f7b210
+Revises: a47b0e9d13f2
+Create Date: 2026-10-17 13:40:18.663250
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a9c5f7b210'
+down_revision = 'a47b0e9d13f2'
+branch_labels = None
+depends_on = None
+
+TABLES = ['Venue', 'Artist', 'Show']
+
+
+def upgrade():
+    # Row-level change tracking: updated_at defaults to the insert time and is
+    # moved forward by a trigger on every update, whatever issued it.
+    op.execute("""
+        CREATE FUNCTION set_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at = now();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    # Table-level change tracking: the time of the last statement that
+    # inserted, updated or deleted rows of each table.
+    op.create_table('TableVersion',
+    sa.Column('table_name', sa.String(length=120), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    op.execute("""
+        CREATE FUNCTION bump_table_version() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO "TableVersion" (table_name, updated_at)
+            VALUES (TG_TABLE_NAME, clock_timestamp())
+            ON CONFLICT (table_name) DO UPDATE SET updated_at = EXCLUDED.updated_at;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for table in TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+        op.execute(f'''
+            CREATE TRIGGER "{table}_set_updated_at" BEFORE UPDATE ON "{table}"
+            FOR EACH ROW EXECUTE PROCEDURE set_updated_at()
+        ''')
+        op.execute(f'''
+            CREATE TRIGGER "{table}_bump_table_version" AFTER INSERT OR UPDATE OR DELETE ON "{table}"
+            FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version()
+        ''')
+        op.execute(f"""INSERT INTO "TableVersion" (table_name) VALUES ('{table}')""")
+
+
+def downgrade():
+    for table in TABLES:
+        op.execute(f'DROP TRIGGER "{table}_bump_table_version" ON "{table}"')
+        op.execute(f'DROP TRIGGER "{table}_set_updated_at" ON "{table}"')
+        op.drop_column(table, 'updated_at')
+    op.execute('DROP FUNCTION bump_table_version()')
+    op.drop_table('TableVersion')
+    op.execute('DROP FUNCTION set_updated_at()')
@@ -0,0 +1,53 @@
+"""add FacetCount
+
+Revision ID: e81b3f5c09a2
+Revises: c4f7a9e21d36
+Create Date: 2026-10-17 21:47:13.602958
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e81b3f5c09a2'
+down_revision = 'c4f7a9e21d36'
+branch_labels = None
+depends_on = None
+
+TABLES = [('Venue', 'venue'), ('Artist', 'artist')]
+
+
+def upgrade():
+    op.create_table('FacetCount',
+    sa.Column('entity', sa.String(length=20), nullable=False),
+    sa.Column('scope', sa.String(length=120), nullable=False),
+    sa.Column('facet', sa.String(length=20), nullable=False),
+    sa.Column('value', sa.String(length=250), nullable=False),
+    sa.Column('count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('entity', 'scope', 'facet', 'value')
+    )
+    # Initial counts, computed as facet_counts.recount_facets does. Writes to
+    # Venue and Artist are blocked meanwhile, as they adjust the counts.
+    op.execute('LOCK TABLE "Venue", "Artist" IN SHARE MODE')
+    for table, entity in TABLES:
+        op.execute(f'''
+            INSERT INTO "FacetCount" (entity, scope, facet, value, count)
+            SELECT '{entity}', s.scope, f.facet, f.value, count(*)
+            FROM "{table}" AS t
+            CROSS JOIN LATERAL (
+                SELECT ARRAY(SELECT DISTINCT genre FROM unnest(t.genres) AS g (genre) WHERE genre <> '') AS genres
+            ) AS n
+            CROSS JOIN LATERAL (SELECT '' UNION ALL SELECT unnest(n.genres)) AS s (scope)
+            CROSS JOIN LATERAL (
+                SELECT 'genre', unnest(n.genres)
+                UNION ALL SELECT 'state', nullif(t.state, '')
+                UNION ALL SELECT 'city', nullif(concat_ws(', ', nullif(t.city, ''), nullif(t.state, '')), '')
+            ) AS f (facet, value)
+            WHERE f.value IS NOT NULL
+            GROUP BY s.scope, f.facet, f.value
+        ''')
+
+
+def downgrade():
+    op.drop_table('FacetCount')
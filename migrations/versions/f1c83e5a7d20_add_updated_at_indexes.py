@@ -0,0 +1,30 @@
+"""add updated_at indexes for incremental exports
+
+Revision ID: f1c83e5a7d20
+Revises: d58a7c2e9f31
+Create Date: 2026-10-17 17:38:42.615093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c83e5a7d20'
+down_revision = 'd58a7c2e9f31'
+branch_labels = None
+depends_on = None
+
+INDEXES = [('ix_venue_updated_at', 'Venue'), ('ix_artist_updated_at', 'Artist'), ('ix_show_updated_at', 'Show')]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table in INDEXES:
+            op.create_index(name, table, ['updated_at'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -1,9 +1,11 @@
 from flask import Flask
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy.dialects import postgresql
 
 from config import SQLALCHEMY_DATABASE_URI
+from db_pool import engine_options
+from replica import RoutingSQLAlchemy
 
 #----------------------------------------------------------------------------#
 # App Config.
@@ -12,7 +14,8 @@ from config import SQLALCHEMY_DATABASE_URI
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+db = RoutingSQLAlchemy(app)
 
 app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False 
@@ -25,6 +28,11 @@ migrate = Migrate(app, db)
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_venue_updated_at', 'updated_at'),
+        db.Index('ix_venue_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -32,40 +40,152 @@ class Venue(db.Model):
     state = db.Column(db.String(120))
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(120)))
+    genres = db.Column(postgresql.ARRAY(db.String(120)))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(120), nullable=True)
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String, nullable=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now(), server_onupdate=db.FetchedValue())
 
     def __repr__(self):
       return '<Venue ID: {} | Venue Name: {}>'.format(self.id, self.name)
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_artist_updated_at', 'updated_at'),
+        db.Index('ix_artist_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(120)))
+    genres = db.Column(postgresql.ARRAY(db.String(120)))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now(), server_onupdate=db.FetchedValue())
 
     def __repr__(self):
       return '<Artist ID: {} | Artist Name: {}>'.format(self.id, self.name)
 
 class Show(db.Model):
     __tablename__ = 'Show'
-    id = db.Column(db.Integer, primary_key=True)
+    __table_args__ = (
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_show_start_time_id', 'start_time', 'id'),
+        db.Index('ix_show_updated_at', 'updated_at'),
+        {'postgresql_partition_by': 'RANGE (start_time)'},
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False)
+    start_time = db.Column(db.DateTime, primary_key=True)
+    start_time_display = db.Column(db.String(120), nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now(), server_onupdate=db.FetchedValue())
+
+    # The table is partitioned by month of start_time, see show_partitions.
+    # Its primary key must include start_time, but ids alone identify shows.
+    __mapper_args__ = {'primary_key': [id]}
 
     def __repr__(self):
         return f'<Show {self.id}>'
+
+# Tables made with create_all() get the default partition only; the monthly
+# ones are added by `flask partition-shows`.
+db.event.listen(Show.__table__, 'after_create', db.DDL('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT'))
+
+class ShowArchive(db.Model):
+    """
+    Shows moved out of Show once past SHOW_ARCHIVE_AFTER_MONTHS, by
+    `flask partition-shows`. It is partitioned by month of start_time like
+    Show, its partitions being former partitions of Show.
+    """
+    __tablename__ = 'ShowArchive'
+    __table_args__ = (
+        db.Index('ix_show_archive_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_archive_artist_id_start_time', 'artist_id', 'start_time'),
+        {'postgresql_partition_by': 'RANGE (start_time)'},
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    start_time = db.Column(db.DateTime, primary_key=True)
+    start_time_display = db.Column(db.String(120), nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+
+    def __repr__(self):
+        return f'<ShowArchive {self.id}>'
+
+class ShowArchiveSummary(db.Model):
+    """
+    The number and first and last start times of the archived shows of each
+    venue and artist pair, maintained as shows are archived. Summed over a
+    venue or an artist, they give the summary of its archived shows.
+    """
+    __tablename__ = 'ShowArchiveSummary'
+    __table_args__ = (
+        db.Index('ix_show_archive_summary_artist_id', 'artist_id'),
+    )
+
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), primary_key=True)
+    shows_count = db.Column(db.Integer, nullable=False)
+    first_start_time = db.Column(db.DateTime, nullable=False)
+    last_start_time = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<ShowArchiveSummary venue {self.venue_id} artist {self.artist_id}: {self.shows_count} shows>'
+
+class FacetCount(db.Model):
+    """
+    Number of venues or artists per genre, state and city, overall and among
+    those of each genre, maintained by facet_counts.
+    """
+    __tablename__ = 'FacetCount'
+
+    entity = db.Column(db.String(20), primary_key=True)
+    scope = db.Column(db.String(120), primary_key=True)
+    facet = db.Column(db.String(20), primary_key=True)
+    value = db.Column(db.String(250), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return f'<FacetCount {self.entity} {self.scope!r} {self.facet} {self.value!r}: {self.count}>'
+
+class TableVersion(db.Model):
+    """
+    The time of the last insert, update or delete on each table, maintained by
+    a statement-level trigger on Venue, Artist and Show.
+    """
+    __tablename__ = 'TableVersion'
+
+    table_name = db.Column(db.String(120), primary_key=True)
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+
+    def __repr__(self):
+        return f'<TableVersion {self.table_name}: {self.updated_at}>'
+
+class ShowCounterState(db.Model):
+    """
+    Single-row table holding the time up to which shows have been moved from
+    the upcoming to the past counters of Venue and Artist.
+    """
+    __tablename__ = 'ShowCounterState'
+
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_over_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<ShowCounterState rolled over at {self.rolled_over_at}>'
@@ -0,0 +1,235 @@
+"""
+Versioned cache for the venue and artist detail pages.
+
+Entries are keyed by entity kind, entity id, a per-entity version counter
+and a digest of the validators of the page, the values its ETag is computed
+from. Writes never delete entries: the handlers bump the version of every
+entity they touch, which makes the old entries unreachable, and those are
+then evicted by the backend in the normal course of things. The validators
+also change on writes the version misses, e.g. to an artist listed on a venue
+page or from another worker, so an entry is only ever served with the ETag
+of the data it holds.
+
+Each entry also carries an expiry time. Detail pages list upcoming and past
+shows separately, so an entry expires when its earliest upcoming show starts,
+as well as after PAGE_CACHE_TTL seconds.
+
+Two backends are available, selected with PAGE_CACHE_BACKEND in config.py:
+
+* 'lru': an in-process LRU holding at most PAGE_CACHE_MAX_ENTRIES entries,
+  and the versions of as many entities. Versions are per process, and other
+  workers see a write through the validators of the page.
+* 'redis': a Redis-compatible server at PAGE_CACHE_REDIS_URL, shared by all
+  workers. Requires the redis package. Page entries are written with a TTL and
+  version counters without one, so the server should run with the
+  volatile-lru eviction policy.
+
+Setting PAGE_CACHE_BACKEND to None disables the cache.
+"""
+import hashlib
+import pickle
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+
+class LRUBackend(object):
+  """
+  In-process LRU store.
+
+  Parameters
+  ----------
+  max_entries : int
+    The number of page entries kept before the least recently used one is
+    evicted, and of version counters kept before the least recently bumped
+    half is dropped.
+  """
+
+  def __init__(self, max_entries):
+    self.max_entries = max_entries
+    self.evictions = 0
+    self._entries = OrderedDict()
+    self._versions = OrderedDict()
+    # The version of the entities without a counter. It is raised to the
+    # counters dropped, so that their entities never go back to a version
+    # they had before.
+    self._epoch = 0
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      value = self._entries.get(key)
+      if value is not None:
+        self._entries.move_to_end(key)
+      return value
+
+  def set(self, key, value, ttl):
+    with self._lock:
+      self._entries[key] = value
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+        self.evictions += 1
+
+  def delete(self, key):
+    with self._lock:
+      self._entries.pop(key, None)
+
+  def get_version(self, key):
+    with self._lock:
+      return self._versions.get(key, self._epoch)
+
+  def incr_version(self, key):
+    with self._lock:
+      version = self._versions.pop(key, self._epoch) + 1
+      self._versions[key] = version
+      if len(self._versions) > self.max_entries:
+        while len(self._versions) > self.max_entries // 2:
+          _, dropped = self._versions.popitem(last=False)
+          self._epoch = max(self._epoch, dropped)
+      return version
+
+  def size(self):
+    return len(self._entries)
+
+
+class RedisBackend(object):
+  """
+  Store backed by a Redis-compatible server.
+
+  Parameters
+  ----------
+  url : str
+    The server URL, e.g. redis://localhost:6379/0.
+  """
+
+  def __init__(self, url):
+    try:
+      import redis
+    except ImportError:
+      raise RuntimeError("PAGE_CACHE_BACKEND = 'redis' requires the redis package.")
+    self._client = redis.Redis.from_url(url)
+
+  @property
+  def evictions(self):
+    return self._client.info('stats').get('evicted_keys', 0)
+
+  def get(self, key):
+    value = self._client.get(key)
+    return pickle.loads(value) if value is not None else None
+
+  def set(self, key, value, ttl):
+    self._client.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=ttl)
+
+  def delete(self, key):
+    self._client.delete(key)
+
+  def get_version(self, key):
+    return int(self._client.get(key) or 0)
+
+  def incr_version(self, key):
+    return self._client.incr(key)
+
+  def size(self):
+    return self._client.dbsize()
+
+
+class PageCache(object):
+  """
+  Versioned cache of the data rendered by the detail pages.
+  """
+
+  def __init__(self):
+    self.backend = None
+    self.ttl = 60
+    self.hits = 0
+    self.misses = 0
+
+  def init_app(self, app):
+    backend = app.config.get('PAGE_CACHE_BACKEND', 'lru')
+    self.ttl = app.config.get('PAGE_CACHE_TTL', 60)
+    if backend == 'lru':
+      self.backend = LRUBackend(app.config.get('PAGE_CACHE_MAX_ENTRIES', 10000))
+    elif backend == 'redis':
+      self.backend = RedisBackend(app.config['PAGE_CACHE_REDIS_URL'])
+    elif backend is not None:
+      raise ValueError(f'Unknown PAGE_CACHE_BACKEND {backend!r}.')
+
+  def _version_key(self, kind, id):
+    return f'fyyur:version:{kind}:{id}'
+
+  def lookup(self, kind, id, validators):
+    """
+    Looks up the cached data of the given entity.
+
+    The returned key embeds the current version of the entity and the
+    validators of the page, and must be passed to store() once the data has
+    been loaded on a miss. If the entity is written meanwhile, its version
+    moves on and the stored data is never served.
+
+    Parameters
+    ----------
+    kind : str
+      'venue' or 'artist'.
+    id : int
+      The entity ID in the database.
+    validators : tuple
+      The validators the ETag of the page is computed from.
+
+    Returns
+    -------
+    (str, object)
+      The cache key, and the cached data or None on a miss.
+    """
+    if self.backend is None:
+      return None, None
+    version = self.backend.get_version(self._version_key(kind, int(id)))
+    digest = hashlib.sha1(repr(validators).encode()).hexdigest()
+    key = f'fyyur:page:{kind}:{int(id)}:{version}:{digest}'
+    entry = self.backend.get(key)
+    if entry is not None:
+      expires_at, data = entry
+      if datetime.now() < expires_at:
+        self.hits += 1
+        return key, data
+      self.backend.delete(key)
+    self.misses += 1
+    return key, None
+
+  def store(self, key, data, expires_at=None):
+    """
+    Caches data under a key returned by lookup() until expires_at, or for the
+    configured TTL if that comes first.
+    """
+    if self.backend is None:
+      return
+    now = datetime.now()
+    ttl_expiry = now + timedelta(seconds=self.ttl)
+    if expires_at is None or expires_at > ttl_expiry:
+      expires_at = ttl_expiry
+    if expires_at <= now:
+      return
+    ttl = max(1, int((expires_at - now).total_seconds()) + 1)
+    self.backend.set(key, (expires_at, data), ttl)
+
+  def bump(self, kind, id):
+    """
+    Invalidates every cached page of the given entity.
+    """
+    if self.backend is not None:
+      self.backend.incr_version(self._version_key(kind, int(id)))
+
+  def stats(self):
+    if self.backend is None:
+      return {'enabled': False}
+    return {
+      'enabled': True,
+      'backend': type(self.backend).__name__,
+      'entries': self.backend.size(),
+      'hits': self.hits,
+      'misses': self.misses,
+      'evictions': self.backend.evictions,
+    }
+
+
+page_cache = PageCache()
@@ -0,0 +1,132 @@
+"""
+Keyset (cursor-based) pagination.
+
+Pages are selected with a WHERE clause on the sort key instead of OFFSET, so
+fetching page N costs the same as fetching page 1 as long as an index covers
+the sort key. A cursor is the opaque, URL-safe encoding of the sort key of the
+first or last row of a page.
+"""
+import base64
+import json
+import operator
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import tuple_
+from sqlalchemy.types import DateTime, Integer, String
+
+Page = namedtuple('Page', ['items', 'next_cursor', 'prev_cursor'])
+
+
+class InvalidCursor(ValueError):
+  pass
+
+
+def encode_cursor(values):
+  """
+  Encodes the sort key values of a row as an opaque cursor string.
+  """
+  payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+  return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+
+
+def decode_value(column, value):
+  """
+  Converts a decoded cursor value back into a value of the column type, and
+  raises TypeError or ValueError if it cannot be one.
+  """
+  if isinstance(column.type, DateTime):
+    return datetime.fromisoformat(value)
+  if isinstance(column.type, Integer) and (not isinstance(value, int) or isinstance(value, bool)):
+    raise TypeError(value)
+  if isinstance(column.type, String) and not isinstance(value, str):
+    raise TypeError(value)
+  return value
+
+
+def decode_cursor(cursor, columns):
+  """
+  Decodes a cursor string back into sort key values for the given columns.
+
+  Raises
+  ------
+  InvalidCursor
+    If the cursor was not produced by encode_cursor for the same columns.
+  """
+  try:
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(values, list) or len(values) != len(columns):
+      raise InvalidCursor(cursor)
+    return tuple(decode_value(column, value) for column, value in zip(columns, values))
+  except (ValueError, TypeError):
+    raise InvalidCursor(cursor)
+
+
+def keyset_paginate(query, columns, limit, after=None, before=None):
+  """
+  Returns one page of the query results, sorted by the given columns.
+
+  The columns must uniquely identify a row, e.g. (Show.start_time, Show.id).
+  They are added to the query, labelled, so they do not need to be selected
+  by the caller.
+
+  Parameters
+  ----------
+  query : sqlalchemy.orm.Query
+    The query to paginate. It must not be ordered or limited.
+  columns : list[Column]
+    The sort key.
+  limit : int
+    The page size.
+  after : str, optional
+    Cursor of the last row of the previous page, to fetch the next page.
+  before : str, optional
+    Cursor of the first row of the next page, to fetch the previous page.
+
+  Returns
+  -------
+  Page
+    The rows of the page, and the cursors of the pages after and before it,
+    or None where there is no such page.
+  """
+  labels = [f'_cursor_{i}' for i in range(len(columns))]
+  query = query.add_columns(*[column.label(label) for column, label in zip(columns, labels)])
+  key = tuple_(*columns) if len(columns) > 1 else columns[0]
+
+  def cursor_of(row):
+    return encode_cursor([getattr(row, label) for label in labels])
+
+  def bound(cursor):
+    values = decode_cursor(cursor, columns)
+    return values if len(columns) > 1 else values[0]
+
+  def leading_bound(cursor, comparison):
+    # Implied by the row comparison, but unlike it usable by the planner to
+    # skip partitions, e.g. those of Show, which is partitioned by start time.
+    if len(columns) == 1:
+      return True
+    return comparison(columns[0], decode_cursor(cursor, columns)[0])
+
+  if before is not None:
+    rows = query.filter(key < bound(before), leading_bound(before, operator.le))\
+      .order_by(*[column.desc() for column in columns])\
+      .limit(limit + 1)\
+      .all()
+    has_prev = len(rows) > limit
+    rows = rows[:limit][::-1]
+    return Page(
+      items=rows,
+      next_cursor=cursor_of(rows[-1]) if rows else before,
+      prev_cursor=cursor_of(rows[0]) if has_prev else None,
+    )
+
+  if after is not None:
+    query = query.filter(key > bound(after), leading_bound(after, operator.ge))
+  rows = query.order_by(*columns).limit(limit + 1).all()
+  has_next = len(rows) > limit
+  rows = rows[:limit]
+  return Page(
+    items=rows,
+    next_cursor=cursor_of(rows[-1]) if has_next else None,
+    prev_cursor=cursor_of(rows[0]) if after is not None and rows else None,
+  )
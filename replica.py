@@ -0,0 +1,102 @@
+"""
+Optional routing of read-only requests to a read replica.
+
+The replica is configured as the 'replica' bind in SQLALCHEMY_BINDS. Views
+decorated with read_only run their session queries against it; every other
+view, and anything flushed to the database, uses the primary.
+
+Since the replica lags behind the primary, a client whose request wrote to
+the database is pinned to the primary for READ_YOUR_WRITES_SECONDS, through a
+timestamp in its session cookie, so that it sees its own changes. Writes are
+detected from session flushes; code writing through an engine connection
+calls mark_written().
+
+Other clients may briefly read data older than the primary's, and the detail
+page cache may keep such a page until its PAGE_CACHE_TTL runs out.
+"""
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import event, orm
+
+REPLICA_BIND = 'replica'
+PRIMARY_UNTIL = '_primary_until'
+
+
+def has_replica(app):
+  return REPLICA_BIND in (app.config.get('SQLALCHEMY_BINDS') or {})
+
+
+class RoutingSession(SignallingSession):
+  """
+  Session sending the queries of read-only views to the replica.
+  """
+
+  def __init__(self, db, **options):
+    self.db = db
+    super(RoutingSession, self).__init__(db, **options)
+
+  def get_bind(self, mapper=None, clause=None):
+    if not self._flushing and has_request_context() and g.get('use_replica'):
+      return self.db.get_engine(self.app, bind=REPLICA_BIND)
+    return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def note_flush(session, flush_context):
+  if has_request_context():
+    mark_written()
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+  def init_app(self, app):
+    super(RoutingSQLAlchemy, self).init_app(app)
+    app.after_request(pin_to_primary)
+
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+  def replica_engine(self):
+    """
+    Returns the replica engine if one is configured, else the primary one.
+    For reads made outside the session, such as exports.
+    """
+    app = self.get_app()
+    return self.get_engine(app, bind=REPLICA_BIND if has_replica(app) else None)
+
+
+def reads_from_replica():
+  """
+  Tells whether the reads of the current request may go to the replica: one
+  is configured, and the client has not written recently.
+  """
+  return has_replica(current_app) and session.get(PRIMARY_UNTIL, 0) <= time.time()
+
+
+def read_only(view):
+  """
+  Runs the session queries of a view on the replica, unless there is none or
+  the client has written recently.
+  """
+  @wraps(view)
+  def wrapper(*args, **kwargs):
+    if reads_from_replica():
+      g.use_replica = True
+    return view(*args, **kwargs)
+  return wrapper
+
+
+def mark_written():
+  """
+  Records that the current request wrote to the primary.
+  """
+  g.db_wrote = True
+
+
+def pin_to_primary(response):
+  if g.get('db_wrote') and has_replica(current_app):
+    session[PRIMARY_UNTIL] = time.time() + current_app.config['READ_YOUR_WRITES_SECONDS']
+  return response
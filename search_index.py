@@ -0,0 +1,270 @@
+"""
+An optional in-memory inverted index over venue and artist names, used to
+answer search-as-you-type lookups without a database round trip.
+
+Every lower-cased name is split into its overlapping n-grams. Each n-gram is
+interned and mapped to a sorted array of the ids whose name contains it. A
+search intersects the posting arrays of the n-grams of the search term, then
+checks the surviving candidates with a plain substring test, so the results
+match the ILIKE '%term%' search done in the database. Names shorter than an
+n-gram have none, and are kept in a separate set scanned by the searches for
+terms that short, the only ones they can match.
+
+The index is enabled with SEARCH_INDEX_ENABLED in config.py. Each worker
+process loads it from the database on its first request, keeps it up to date
+from the create, edit and delete handlers, and reconciles it against the
+database every SEARCH_INDEX_RECONCILE_SECONDS to pick up writes made by other
+processes.
+"""
+import logging
+import os
+import sys
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+SearchResult = namedtuple('SearchResult', ['id', 'name', 'total'])
+
+
+class NGramIndex(object):
+  """
+  Inverted index from n-grams to the ids of the names containing them.
+
+  Parameters
+  ----------
+  n : int
+    The n-gram length.
+  """
+
+  def __init__(self, n=3):
+    self.n = n
+    self._postings = {}
+    self._names = {}
+    self._short = set()
+    self._lock = threading.RLock()
+
+  def __len__(self):
+    return len(self._names)
+
+  def ngrams(self, text):
+    """
+    Returns the set of interned n-grams of the lower-cased text.
+    """
+    text = text.lower()
+    return {sys.intern(text[i:i + self.n]) for i in range(len(text) - self.n + 1)}
+
+  def add(self, id, name):
+    """
+    Adds or replaces the name indexed under id.
+    """
+    with self._lock:
+      if id in self._names:
+        self._remove(id)
+      name = name or ''
+      self._names[id] = name
+      if len(name) < self.n:
+        self._short.add(id)
+      for ngram in self.ngrams(name):
+        posting = self._postings.get(ngram)
+        if posting is None:
+          self._postings[ngram] = array('I', [id])
+        else:
+          insort(posting, id)
+
+  def remove(self, id):
+    """
+    Removes id from the index, if present.
+    """
+    with self._lock:
+      if id in self._names:
+        self._remove(id)
+
+  def _remove(self, id):
+    self._short.discard(id)
+    for ngram in self.ngrams(self._names.pop(id)):
+      posting = self._postings[ngram]
+      del posting[bisect_left(posting, id)]
+      if not posting:
+        del self._postings[ngram]
+
+  def items(self):
+    """
+    Returns a snapshot of the indexed (id, name) pairs.
+    """
+    with self._lock:
+      return list(self._names.items())
+
+  def search(self, term, limit=None):
+    """
+    Performs a case-insensitive partial string search.
+
+    Matches are ranked by the share of n-grams they have in common with the
+    search term, then by id.
+
+    Parameters
+    ----------
+    term : str
+      The partial name to search for.
+    limit : int, optional
+      The maximum number of results to return.
+
+    Returns
+    -------
+    list[SearchResult]
+      The (id, name, total) tuples of the best matches, where total is the
+      number of matches before the limit is applied.
+    """
+    needle = term.lower()
+    with self._lock:
+      if len(needle) >= self.n:
+        postings = sorted((self._postings.get(ngram, ()) for ngram in self.ngrams(needle)), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+          if not candidates:
+            break
+          candidates.intersection_update(posting)
+      elif needle:
+        candidates = set(self._short)
+        for ngram, posting in self._postings.items():
+          if needle in ngram:
+            candidates.update(posting)
+      else:
+        candidates = set(self._names)
+      matches = [(id, self._names[id]) for id in candidates if needle in self._names[id].lower()]
+
+    term_ngrams = self.ngrams(needle)
+
+    def rank(match):
+      name_ngrams = self.ngrams(match[1])
+      union = len(term_ngrams | name_ngrams) or 1
+      return (-len(term_ngrams & name_ngrams) / union, match[0])
+
+    matches.sort(key=rank)
+    total = len(matches)
+    if limit is not None:
+      matches = matches[:limit]
+    return [SearchResult(id, name, total) for id, name in matches]
+
+  def memory_usage(self):
+    """
+    Returns an estimate of the memory held by the index, in bytes.
+    """
+    with self._lock:
+      size = sys.getsizeof(self._postings) + sys.getsizeof(self._names) + sys.getsizeof(self._short)
+      for ngram, posting in self._postings.items():
+        size += sys.getsizeof(ngram) + sys.getsizeof(posting)
+      for id, name in self._names.items():
+        size += sys.getsizeof(id) + sys.getsizeof(name)
+      return size
+
+
+class SearchIndex(object):
+  """
+  The per-process venue and artist name indexes, and their synchronisation
+  with the database.
+  """
+
+  def __init__(self):
+    self.app = None
+    self.enabled = False
+    self.indexes = {}
+    self._pid = None
+    self._lock = threading.Lock()
+
+  def init_app(self, app):
+    self.app = app
+    self.enabled = app.config.get('SEARCH_INDEX_ENABLED', False)
+    if self.enabled:
+      app.before_request(self.ensure_loaded)
+
+  def ensure_loaded(self):
+    """
+    Loads the indexes and starts the reconcile thread once per process.
+
+    Checking the process id means that a worker forked from a parent which
+    already loaded the index (e.g. gunicorn --preload) loads its own copy and
+    runs its own reconcile thread.
+    """
+    if self._pid == os.getpid():
+      return
+    with self._lock:
+      if self._pid == os.getpid():
+        return
+      n = self.app.config.get('SEARCH_INDEX_NGRAM_SIZE', 3)
+      self.indexes = {'venue': NGramIndex(n), 'artist': NGramIndex(n)}
+      self.reconcile()
+      self._pid = os.getpid()
+      self._schedule_reconcile()
+
+  def _schedule_reconcile(self):
+    interval = self.app.config.get('SEARCH_INDEX_RECONCILE_SECONDS', 300)
+    timer = threading.Timer(interval, self._run_reconcile)
+    timer.daemon = True
+    timer.start()
+
+  def _run_reconcile(self):
+    try:
+      with self.app.app_context():
+        self.reconcile()
+    except Exception:
+      logger.exception('Search index reconcile failed.')
+    finally:
+      self._schedule_reconcile()
+
+  def reconcile(self):
+    """
+    Brings the indexes in line with the Venue and Artist tables, adding,
+    renaming and removing entries as needed.
+
+    The tables are read on a connection of its own, as reconcile also runs
+    within requests, e.g. after an import, whose session it must not touch.
+    """
+    from models import Venue, Artist, db
+
+    with db.engine.connect() as connection:
+      for kind, model in (('venue', Venue), ('artist', Artist)):
+        index = self.indexes[kind]
+        rows = dict(connection.execute(db.select([model.id, model.name])).fetchall())
+        indexed = dict(index.items())
+        for id in indexed.keys() - rows.keys():
+          index.remove(id)
+        for id, name in rows.items():
+          if indexed.get(id) != (name or ''):
+            index.add(id, name)
+
+  def is_ready(self):
+    return self.enabled and self._pid == os.getpid()
+
+  def update(self, kind, entity):
+    """
+    Indexes the name of a committed Venue or Artist. Does nothing, not even
+    touch the entity, when the index is not in use.
+    """
+    if self.is_ready():
+      self.indexes[kind].add(entity.id, entity.name)
+
+  def remove(self, kind, id):
+    """
+    Drops a deleted Venue or Artist from the index.
+    """
+    if self.is_ready():
+      self.indexes[kind].remove(int(id))
+
+  def search(self, kind, term, limit=None):
+    return self.indexes[kind].search(term, limit)
+
+  def stats(self):
+    return {
+      kind: {
+        'entries': len(index),
+        'ngrams': len(index._postings),
+        'memory_bytes': index.memory_usage(),
+      }
+      for kind, index in self.indexes.items()
+    }
+
+
+search_index = SearchIndex()
@@ -0,0 +1,297 @@
+"""
+Synthetic venues, artists and shows for performance testing.
+
+`flask seed --venues N --artists M --shows K` adds generated rows to the
+database, loaded with COPY SEED_BATCH_SIZE rows at a time. The data follows
+the shapes of real listings rather than being uniform:
+
+* states and genres are drawn from the choices of VenueForm and ArtistForm,
+  with a few large cities holding most venues and artists;
+* shows per venue and per artist follow a heavy-tailed distribution, so a
+  few venues host thousands of shows while most host a handful;
+* start times fall in the evening, spread from SEED_PAST_DAYS before the
+  current day to SEED_FUTURE_DAYS after it, so pages have both past and
+  upcoming shows.
+
+The same --seed generates the same rows on a given day, so benchmark datasets
+can be rebuilt identically. Ids come from the table sequences and depend on
+what the database already holds; use an empty database for identical ids
+too.
+
+Everything is loaded in one transaction. COPY bypasses the ORM events, so
+the facet counts of the new venues and artists are adjusted batch by batch,
+and their show counters are computed while the shows are generated and
+written at the end, against the rollover watermark, which stays
+share-locked until the commit; the rollover thread of running workers waits
+meanwhile. The new rows have fresh ids, so no cached detail page can refer
+to them, and running workers add them to their search index at the next
+reconcile. The monthly Show partitions of the generated start times are
+created first.
+"""
+import random
+import time
+from array import array
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+import click
+from sqlalchemy import text
+
+from bulk_import import copy_rows
+from facet_counts import adjust_facets_bulk
+from formatting import format_datetime
+from forms import VenueForm
+from models import Venue, Artist, Show, app, db
+from show_counters import COUNTED_TABLES, lock_watermark
+from show_partitions import ensure_partitions
+
+SEED_BATCH_SIZE = 50000
+SEED_PAST_DAYS = 3 * 365
+SEED_FUTURE_DAYS = 365
+
+STATES = [value for value, label in VenueForm.state.kwargs['choices']]
+GENRES = [value for value, label in VenueForm.genres.kwargs['choices']]
+
+# A few large cities, each with a weight, hold most of the venues and artists.
+# Entities outside them get a generic city in a random state.
+CITIES = [
+  ('New York', 'NY', 20), ('Los Angeles', 'CA', 16), ('Chicago', 'IL', 10), ('Nashville', 'TN', 8),
+  ('Austin', 'TX', 8), ('San Francisco', 'CA', 7), ('Seattle', 'WA', 6), ('New Orleans', 'LA', 6),
+  ('Atlanta', 'GA', 5), ('Boston', 'MA', 5), ('Denver', 'CO', 4), ('Philadelphia', 'PA', 4),
+  ('Portland', 'OR', 4), ('Detroit', 'MI', 3), ('Minneapolis', 'MN', 3), ('Miami', 'FL', 3),
+]
+OTHER_CITY_WEIGHT = 15
+CITY_CUM_WEIGHTS = list(accumulate([weight for city, state, weight in CITIES] + [OTHER_CITY_WEIGHT]))
+
+ADJECTIVES = [
+  'Blue', 'Golden', 'Velvet', 'Electric', 'Silver', 'Midnight', 'Crimson', 'Wild', 'Rusty', 'Lucky',
+  'Hollow', 'Neon', 'Broken', 'Quiet', 'Little', 'Grand', 'Lost', 'Copper', 'Shady', 'Northern',
+]
+NOUNS = [
+  'Room', 'Lantern', 'Anchor', 'Owl', 'Harbor', 'Garden', 'Tavern', 'Mill', 'Lounge', 'Cellar',
+  'Parlor', 'Station', 'Barn', 'Theatre', 'Hall', 'Pier', 'Attic', 'Foundry', 'Orchard', 'Cabin',
+]
+BAND_NOUNS = [
+  'Foxes', 'Saints', 'Echoes', 'Rivers', 'Wolves', 'Strangers', 'Engines', 'Sparrows', 'Ghosts', 'Kings',
+  'Pilots', 'Orchids', 'Drifters', 'Machines', 'Heralds', 'Tides', 'Lions', 'Comets', 'Shadows', 'Hearts',
+]
+STREETS = ['Main', 'Market', 'Mission', 'Elm', 'Oak', 'Maple', 'Broadway', 'Sunset', 'Park', 'Lake']
+STREET_SUFFIXES = ['Street', 'Avenue', 'Boulevard', 'Road', 'Lane']
+
+
+def popularity(rng, n):
+  """
+  Returns the heavy-tailed show weights of n venues or artists.
+  """
+  return [rng.paretovariate(1.2) for _ in range(n)]
+
+
+def pick_location(rng):
+  location = rng.choices(CITIES + [None], cum_weights=CITY_CUM_WEIGHTS)[0]
+  if location is None:
+    return f'{rng.choice(NOUNS)}ville', rng.choice(STATES)
+  city, state, weight = location
+  return city, state
+
+
+def pick_genres(rng):
+  return rng.sample(GENRES, rng.choice([1, 1, 1, 2, 2, 3]))
+
+
+def slug(name, index):
+  return '-'.join(name.lower().split()) + f'-{index}'
+
+
+def venue_row(rng, id, index):
+  name = f'The {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}'
+  city, state = pick_location(rng)
+  seeking_talent = rng.random() < 0.3
+  return {
+    'id': id,
+    'name': name,
+    'city': city,
+    'state': state,
+    'address': f'{rng.randint(1, 9999)} {rng.choice(STREETS)} {rng.choice(STREET_SUFFIXES)}',
+    'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(0, 9999):04d}',
+    'genres': pick_genres(rng),
+    'image_link': f'https://images.example.com/venues/{index}.jpg',
+    'facebook_link': f'https://www.facebook.com/{slug(name, index)}',
+    'website_link': f'https://www.{slug(name, index)}.example.com' if rng.random() < 0.6 else None,
+    'seeking_talent': seeking_talent,
+    'seeking_description': 'We are looking for local acts to play on weekends.' if seeking_talent else None,
+  }
+
+
+def artist_row(rng, id, index):
+  name = f'{rng.choice(ADJECTIVES)} {rng.choice(BAND_NOUNS)}' if rng.random() < 0.7 \
+    else f'The {rng.choice(ADJECTIVES)} {rng.choice(BAND_NOUNS)}'
+  city, state = pick_location(rng)
+  seeking_venue = rng.random() < 0.3
+  return {
+    'id': id,
+    'name': name,
+    'city': city,
+    'state': state,
+    'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(0, 9999):04d}',
+    'genres': pick_genres(rng),
+    'image_link': f'https://images.example.com/artists/{index}.jpg',
+    'facebook_link': f'https://www.facebook.com/{slug(name, index)}',
+    'website_link': f'https://www.{slug(name, index)}.example.com' if rng.random() < 0.4 else None,
+    'seeking_venue': seeking_venue,
+    'seeking_description': 'Looking for shows in the area.' if seeking_venue else None,
+  }
+
+
+def reserve_ids(connection, table, n):
+  """
+  Takes n ids from the id sequence of the table.
+  """
+  return [row[0] for row in connection.execute(
+    text(f"""SELECT nextval(pg_get_serial_sequence('"{table}"', 'id')) FROM generate_series(1, :n)"""),
+    {'n': n}
+  )]
+
+
+def load_entities(connection, model, make_row, rng, n, batch_size):
+  """
+  Generates and loads n venues or artists, and adds them to the facet
+  counts.
+
+  Returns
+  -------
+  list[int]
+    The ids of the new rows.
+  """
+  ids = reserve_ids(connection, model.__tablename__, n)
+  columns = None
+  for start in range(0, n, batch_size):
+    rows = [make_row(rng, ids[index], index) for index in range(start, min(start + batch_size, n))]
+    columns = columns or list(rows[0])
+    copy_rows(connection, model.__tablename__, columns, rows)
+    adjust_facets_bulk(connection, model, rows)
+  return ids
+
+
+def load_shows(connection, rng, venue_ids, artist_ids, n, batch_size, watermark):
+  """
+  Generates and loads n shows between the given venues and artists, counting
+  them as upcoming or past against the watermark.
+
+  Returns
+  -------
+  dict
+    The (upcoming, past) counts of each counted table, as arrays parallel to
+    venue_ids and artist_ids.
+  """
+  venue_weights = list(accumulate(popularity(rng, len(venue_ids))))
+  artist_weights = list(accumulate(popularity(rng, len(artist_ids))))
+  counts = {
+    'Venue': (array('l', [0]) * len(venue_ids), array('l', [0]) * len(venue_ids)),
+    'Artist': (array('l', [0]) * len(artist_ids), array('l', [0]) * len(artist_ids)),
+  }
+  first_day = datetime.combine(datetime.now().date(), datetime.min.time()) - timedelta(days=SEED_PAST_DAYS)
+  days = SEED_PAST_DAYS + SEED_FUTURE_DAYS
+  ensure_partitions(connection, first_day.date(), (first_day + timedelta(days=days)).date())
+  columns = ['venue_id', 'artist_id', 'start_time']
+  display = app.config.get('SHOW_DISPLAY_STRINGS')
+  if display:
+    columns.append('start_time_display')
+
+  for start in range(0, n, batch_size):
+    size = min(batch_size, n - start)
+    venues = rng.choices(range(len(venue_ids)), cum_weights=venue_weights, k=size)
+    artists = rng.choices(range(len(artist_ids)), cum_weights=artist_weights, k=size)
+    rows = []
+    for venue, artist in zip(venues, artists):
+      start_time = first_day + timedelta(days=rng.randrange(days), hours=rng.randint(18, 23), minutes=rng.choice([0, 30]))
+      side = 0 if start_time > watermark else 1
+      counts['Venue'][side][venue] += 1
+      counts['Artist'][side][artist] += 1
+      row = {'venue_id': venue_ids[venue], 'artist_id': artist_ids[artist], 'start_time': start_time}
+      if display:
+        row['start_time_display'] = format_datetime(start_time, 'full')
+      rows.append(row)
+    copy_rows(connection, Show.__tablename__, columns, rows)
+  return counts
+
+
+def write_counters(connection, table, ids, counts):
+  """
+  Sets the show counters of the new rows of a table, through a temporary
+  table loaded with COPY and a single UPDATE.
+  """
+  upcoming, past = counts
+  connection.execute(text(
+    'CREATE TEMPORARY TABLE seed_counts (id integer, upcoming integer, past integer)'
+  ))
+  copy_rows(connection, 'seed_counts', ['id', 'upcoming', 'past'], (
+    {'id': id, 'upcoming': upcoming[index], 'past': past[index]}
+    for index, id in enumerate(ids) if upcoming[index] or past[index]
+  ))
+  connection.execute(text(f'''
+    UPDATE "{table}" AS t
+    SET upcoming_shows_count = t.upcoming_shows_count + c.upcoming,
+        past_shows_count = t.past_shows_count + c.past
+    FROM seed_counts AS c
+    WHERE t.id = c.id
+  '''))
+  connection.execute(text('DROP TABLE seed_counts'))
+
+
+def seed(venues, artists, shows, random_seed=0, batch_size=None, log=None):
+  """
+  Generates and loads synthetic venues, artists and shows in one
+  transaction.
+
+  Parameters
+  ----------
+  venues, artists, shows : int
+    The number of rows of each to add. Shows need at least one venue and one
+    artist.
+  random_seed : int
+    The random seed; the same seed generates the same rows.
+  batch_size : int, optional
+    The number of rows per COPY, SEED_BATCH_SIZE by default.
+  log : callable, optional
+    Called with a progress message after each step.
+
+  Returns
+  -------
+  (list[int], list[int])
+    The ids of the new venues and artists.
+  """
+  rng = random.Random(random_seed)
+  batch_size = batch_size or SEED_BATCH_SIZE
+  log = log or (lambda message: None)
+  started = time.perf_counter()
+
+  with db.engine.begin() as connection:
+    watermark = lock_watermark(connection, 'SHARE')
+    venue_ids = load_entities(connection, Venue, venue_row, rng, venues, batch_size)
+    log(f'{venues} venues loaded in {time.perf_counter() - started:.1f}s')
+    artist_ids = load_entities(connection, Artist, artist_row, rng, artists, batch_size)
+    log(f'{artists} artists loaded in {time.perf_counter() - started:.1f}s')
+    if shows:
+      counts = load_shows(connection, rng, venue_ids, artist_ids, shows, batch_size, watermark)
+      log(f'{shows} shows loaded in {time.perf_counter() - started:.1f}s')
+      ids = {'Venue': venue_ids, 'Artist': artist_ids}
+      for table, key in COUNTED_TABLES:
+        write_counters(connection, table, ids[table], counts[table])
+      log(f'show counters written in {time.perf_counter() - started:.1f}s')
+    # Fresh statistics, so that the planner sees the new table sizes at once.
+    connection.execute(text('ANALYZE "Venue", "Artist", "Show"'))
+  log(f'done in {time.perf_counter() - started:.1f}s')
+  return venue_ids, artist_ids
+
+
+@app.cli.command('seed')
+@click.option('--venues', type=click.IntRange(min=0), default=1000, show_default=True)
+@click.option('--artists', type=click.IntRange(min=0), default=1000, show_default=True)
+@click.option('--shows', type=click.IntRange(min=0), default=10000, show_default=True)
+@click.option('--seed', 'random_seed', type=int, default=0, show_default=True, help='The same seed generates the same rows.')
+@click.option('--batch-size', type=click.IntRange(min=1), help=f'Rows per COPY, {SEED_BATCH_SIZE} by default.')
+def seed_command(venues, artists, shows, random_seed, batch_size):
+  """Add synthetic venues, artists and shows for performance testing."""
+  if shows and not (venues and artists):
+    raise click.UsageError('Shows need at least one venue and one artist.')
+  seed(venues, artists, shows, random_seed, batch_size, log=click.echo)
@@ -0,0 +1,287 @@
+"""
+Materialized upcoming and past show counters on Venue and Artist.
+
+Every venue and artist carries upcoming_shows_count and past_shows_count.
+The counters are kept relative to a watermark, ShowCounterState.rolled_over_at:
+a show counts as upcoming if it starts after the watermark, and as past
+otherwise.
+
+* Inserting or deleting a Show through the ORM adjusts the counters of its
+  venue and artist in the same transaction. Bulk loads that bypass the ORM
+  call adjust_counters_bulk instead.
+* roll_over_shows() moves the shows that started between the watermark and
+  now from upcoming to past, then advances the watermark. It runs every
+  SHOW_COUNTER_ROLLOVER_SECONDS in each worker, and is also available as
+  `flask rollover-shows` for running from cron.
+* `flask recount-shows` recomputes every counter from the Show and
+  ShowArchive tables, archived shows counting as past, and reports the ones
+  that had drifted, e.g. after rows were written with raw SQL. With --check
+  it only reports.
+
+Show inserts take a share lock on the watermark row, and the rollover an
+exclusive one. A show committed while a rollover runs is therefore either
+seen by the rollover or classified against the new watermark.
+"""
+import logging
+import os
+import sys
+import threading
+from datetime import datetime
+
+import click
+import dateutil.parser
+from sqlalchemy import event, text
+
+from models import Show, app, db
+
+logger = logging.getLogger(__name__)
+
+COUNTED_TABLES = [('Venue', 'venue_id'), ('Artist', 'artist_id')]
+
+
+def lock_watermark(connection, mode):
+  """
+  Locks the watermark row in the given mode ('SHARE' or 'UPDATE'), creating
+  it first if needed, and returns the watermark.
+
+  The watermark is compared with the start times of shows and with
+  datetime.now() of the app, so it is created from the clock of the app
+  rather than the now() of the database session, whose time zone may differ.
+  """
+  select_watermark = text(f'SELECT rolled_over_at FROM "ShowCounterState" WHERE id = 1 FOR {mode}')
+  watermark = connection.execute(select_watermark).scalar()
+  if watermark is None:
+    connection.execute(text(
+      'INSERT INTO "ShowCounterState" (id, rolled_over_at) VALUES (1, :now) ON CONFLICT (id) DO NOTHING'
+    ), {'now': datetime.now()})
+    watermark = connection.execute(select_watermark).scalar()
+  return watermark
+
+
+def adjust_counters(connection, show, delta):
+  """
+  Adds delta to the upcoming or past counter of the venue and the artist of
+  the show, depending on which side of the watermark it starts.
+  """
+  watermark = lock_watermark(connection, 'SHARE')
+  counter = 'upcoming_shows_count' if show.start_time > watermark else 'past_shows_count'
+  for table, key in COUNTED_TABLES:
+    connection.execute(
+      text(f'UPDATE "{table}" SET {counter} = {counter} + :delta WHERE id = :id'),
+      {'delta': delta, 'id': getattr(show, key)}
+    )
+
+
+def adjust_counters_bulk(connection, shows):
+  """
+  Adds shows inserted without going through the ORM, e.g. with COPY, to the
+  counters of their venues and artists, in the same transaction.
+
+  Parameters
+  ----------
+  connection : sqlalchemy.engine.Connection
+    The connection the shows were inserted with.
+  shows : list[dict]
+    The venue_id, artist_id and start_time of each show.
+  """
+  watermark = lock_watermark(connection, 'SHARE')
+  for table, key in COUNTED_TABLES:
+    deltas = {}
+    for show in shows:
+      upcoming, past = deltas.get(show[key], (0, 0))
+      if show['start_time'] > watermark:
+        deltas[show[key]] = (upcoming + 1, past)
+      else:
+        deltas[show[key]] = (upcoming, past + 1)
+    if deltas:
+      connection.execute(
+        text(f'''
+          UPDATE "{table}"
+          SET upcoming_shows_count = upcoming_shows_count + :upcoming,
+              past_shows_count = past_shows_count + :past
+          WHERE id = :id
+        '''),
+        [{'id': id, 'upcoming': upcoming, 'past': past} for id, (upcoming, past) in deltas.items()]
+      )
+
+
+@event.listens_for(Show, 'before_insert')
+def parse_start_time(mapper, connection, show):
+  # The start time may be given as posted by a form, and is compared with the
+  # watermark once inserted.
+  if isinstance(show.start_time, str):
+    show.start_time = dateutil.parser.parse(show.start_time)
+
+
+@event.listens_for(Show, 'after_insert')
+def count_inserted_show(mapper, connection, show):
+  adjust_counters(connection, show, 1)
+
+
+@event.listens_for(Show, 'after_delete')
+def count_deleted_show(mapper, connection, show):
+  adjust_counters(connection, show, -1)
+
+
+def roll_over_shows():
+  """
+  Moves the shows that started since the last rollover from the upcoming to
+  the past counters of their venues and artists.
+
+  Returns
+  -------
+  int
+    The number of shows rolled over.
+  """
+  with db.engine.begin() as connection:
+    watermark = lock_watermark(connection, 'UPDATE')
+    now = datetime.now()
+    if now <= watermark:
+      return 0
+    window = {'watermark': watermark, 'now': now}
+    # The shows that started in the window, counted per venue, per artist and
+    # in total with one scan. GROUPING tells the sets apart: 1 for the venue
+    # rows, 2 for the artist rows and 3 for the total.
+    rows = connection.execute(text('''
+      SELECT GROUPING(venue_id, artist_id) AS grouping, venue_id, artist_id, count(*) AS shows
+      FROM "Show"
+      WHERE start_time > :watermark AND start_time <= :now
+      GROUP BY GROUPING SETS ((venue_id), (artist_id), ())
+    '''), window).fetchall()
+    crossed = {'venue_id': [], 'artist_id': []}
+    rolled_over = 0
+    for grouping, venue_id, artist_id, shows in rows:
+      if grouping == 1:
+        crossed['venue_id'].append({'id': venue_id, 'shows': shows})
+      elif grouping == 2:
+        crossed['artist_id'].append({'id': artist_id, 'shows': shows})
+      else:
+        rolled_over = shows
+    # Skipped when no show started, as every statement on Venue and Artist,
+    # even one updating no row, bumps their TableVersion and with it the
+    # ETags of the listings.
+    for table, key in COUNTED_TABLES:
+      if crossed[key]:
+        connection.execute(text(f'''
+          UPDATE "{table}"
+          SET upcoming_shows_count = upcoming_shows_count - :shows,
+              past_shows_count = past_shows_count + :shows
+          WHERE id = :id
+        '''), crossed[key])
+    connection.execute(text('UPDATE "ShowCounterState" SET rolled_over_at = :now WHERE id = 1'), window)
+  return rolled_over
+
+
+def recount_shows(fix=True):
+  """
+  Recomputes every counter from the Show table and, for past shows, the
+  ShowArchive table.
+
+  Parameters
+  ----------
+  fix : bool
+    Whether to overwrite the counters that drifted, or only report them.
+
+  Returns
+  -------
+  list[tuple]
+    The (table, id, stored_upcoming, stored_past, upcoming, past) rows of
+    the counters that had drifted.
+  """
+  drifted = []
+  with db.engine.begin() as connection:
+    lock_watermark(connection, 'UPDATE')
+    now = datetime.now()
+    for table, key in COUNTED_TABLES:
+      actual = f'''
+        SELECT t.id,
+               t.upcoming_shows_count AS stored_upcoming,
+               t.past_shows_count AS stored_past,
+               count(s.id) FILTER (WHERE s.start_time > :now) AS upcoming,
+               count(s.id) FILTER (WHERE s.start_time <= :now) AS past
+        FROM "{table}" AS t
+        LEFT JOIN (
+          SELECT id, {key}, start_time FROM "Show"
+          UNION ALL
+          SELECT id, {key}, start_time FROM "ShowArchive"
+        ) AS s ON s.{key} = t.id
+        GROUP BY t.id
+      '''
+      rows = connection.execute(text(f'''
+        SELECT id, stored_upcoming, stored_past, upcoming, past FROM ({actual}) AS a
+        WHERE (stored_upcoming, stored_past) IS DISTINCT FROM (upcoming, past)
+        ORDER BY id
+      '''), {'now': now}).fetchall()
+      drifted.extend((table,) + tuple(row) for row in rows)
+      if fix and rows:
+        connection.execute(text(f'''
+          UPDATE "{table}" AS t
+          SET upcoming_shows_count = a.upcoming, past_shows_count = a.past
+          FROM ({actual}) AS a
+          WHERE t.id = a.id
+            AND (a.stored_upcoming, a.stored_past) IS DISTINCT FROM (a.upcoming, a.past)
+        '''), {'now': now})
+    if fix:
+      connection.execute(text('UPDATE "ShowCounterState" SET rolled_over_at = :now WHERE id = 1'), {'now': now})
+  return drifted
+
+
+class RolloverScheduler(object):
+  """
+  Runs roll_over_shows every SHOW_COUNTER_ROLLOVER_SECONDS from a daemon
+  thread, started on the first request of each worker process.
+  """
+
+  def __init__(self):
+    self.app = None
+    self._pid = None
+    self._lock = threading.Lock()
+
+  def init_app(self, app):
+    self.app = app
+    if app.config.get('SHOW_COUNTER_ROLLOVER_SECONDS'):
+      app.before_request(self.ensure_started)
+
+  def ensure_started(self):
+    if self._pid == os.getpid():
+      return
+    with self._lock:
+      if self._pid == os.getpid():
+        return
+      self._pid = os.getpid()
+      self._schedule()
+
+  def _schedule(self):
+    timer = threading.Timer(self.app.config['SHOW_COUNTER_ROLLOVER_SECONDS'], self._run)
+    timer.daemon = True
+    timer.start()
+
+  def _run(self):
+    try:
+      with self.app.app_context():
+        roll_over_shows()
+    except Exception:
+      logger.exception('Show counter rollover failed.')
+    finally:
+      self._schedule()
+
+
+rollover_scheduler = RolloverScheduler()
+
+
+@app.cli.command('rollover-shows')
+def rollover_shows_command():
+  """Move started shows from the upcoming to the past counters."""
+  click.echo(f'Rolled over {roll_over_shows()} shows.')
+
+
+@app.cli.command('recount-shows')
+@click.option('--check', is_flag=True, help='Only report drifted counters, and exit with status 1 if any.')
+def recount_shows_command(check):
+  """Recompute the upcoming and past show counters from scratch."""
+  drifted = recount_shows(fix=not check)
+  for table, id, stored_upcoming, stored_past, upcoming, past in drifted:
+    click.echo(f'{table} {id}: upcoming {stored_upcoming} -> {upcoming}, past {stored_past} -> {past}')
+  click.echo(f'{len(drifted)} drifted counters {"found" if check else "fixed"}.')
+  if check and drifted:
+    sys.exit(1)
@@ -0,0 +1,300 @@
+"""
+Monthly partitions of the Show table.
+
+"Show" is range-partitioned by start_time, one partition per month named
+after it, e.g. "Show_y2026m10" for October 2026, plus the "Show_default"
+partition holding the shows of months without one. Queries restricted on
+start_time, such as those of upcoming shows, only read the partitions of the
+months they cover.
+
+`flask partition-shows` maintains them, and is meant to run daily from cron:
+
+* it creates the partitions of the current month and of the next
+  SHOW_PARTITION_MONTHS_AHEAD months, moving any of their shows out of the
+  default partition;
+* with SHOW_ARCHIVE_AFTER_MONTHS set, it archives the shows of the months
+  ended more than that many months ago: their partitions are detached from
+  "Show" and attached to "ShowArchive", renamed e.g. "ShowArchive_y2024m03",
+  and such shows of the default partition are moved there too.
+
+Archived shows are summed up per venue and artist pair in ShowArchiveSummary
+as they are archived, and the venue and artist pages show these summaries
+instead of listing them. They still count in the past show counters of their
+venues and artists, so partitions are only archived once all of their shows
+are past the rollover watermark of show_counters.
+"""
+import re
+from datetime import date, datetime, time
+
+import click
+from sqlalchemy import text
+
+from models import app, db
+from page_cache import page_cache
+from show_counters import lock_watermark
+
+DEFAULT_PARTITION = 'Show_default'
+ARCHIVE_TABLE = 'ShowArchive'
+COLUMNS = 'id, artist_id, venue_id, start_time, start_time_display, updated_at'
+BOUNDS = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def add_months(month, months):
+  """
+  Returns the first day of the month the given number of months after the
+  month of the given date.
+  """
+  index = month.year * 12 + month.month - 1 + months
+  return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month, table='Show'):
+  return f'{table}_y{month.year}m{month.month:02d}'
+
+
+def list_partitions(connection, table='Show'):
+  """
+  Lists the monthly partitions of "Show", or of the given table.
+
+  Returns
+  -------
+  list[(str, date, date)]
+    The name, first day and first day after the month of each partition, in
+    month order. The default partition is not included.
+  """
+  rows = connection.execute(text('''
+    SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+    FROM pg_inherits AS i
+    JOIN pg_class AS c ON c.oid = i.inhrelid
+    WHERE i.inhparent = CAST(:table AS regclass)
+  '''), {'table': f'"{table}"'}).fetchall()
+  partitions = []
+  for name, bound in rows:
+    match = BOUNDS.search(bound)
+    if match:
+      lower, upper = (datetime.fromisoformat(value).date() for value in match.groups())
+      partitions.append((name, lower, upper))
+  return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_partition(connection, month):
+  """
+  Creates the partition of a month. Shows of that month already in the
+  default partition are moved to it, with the default partition detached
+  meanwhile, since it must never hold rows within the bounds of another
+  partition.
+  """
+  name, lower, upper = partition_name(month), month, add_months(month, 1)
+  bounds = {'lower': lower, 'upper': upper}
+  create = text(f'''
+    CREATE TABLE "{name}" PARTITION OF "Show" FOR VALUES FROM ('{lower}') TO ('{upper}')
+  ''')
+  misplaced = connection.execute(text(f'''
+    SELECT EXISTS (SELECT 1 FROM "{DEFAULT_PARTITION}" WHERE start_time >= :lower AND start_time < :upper)
+  '''), bounds).scalar()
+  if not misplaced:
+    connection.execute(create)
+    return
+  connection.execute(text(f'ALTER TABLE "Show" DETACH PARTITION "{DEFAULT_PARTITION}"'))
+  connection.execute(create)
+  connection.execute(text(f'''
+    WITH moved AS (
+      DELETE FROM "{DEFAULT_PARTITION}" WHERE start_time >= :lower AND start_time < :upper RETURNING *
+    )
+    INSERT INTO "Show" SELECT * FROM moved
+  '''), bounds)
+  connection.execute(text(f'ALTER TABLE "Show" ATTACH PARTITION "{DEFAULT_PARTITION}" DEFAULT'))
+
+
+def ensure_partitions(connection, first_month, last_month):
+  """
+  Creates the missing partitions of the months from first_month to
+  last_month included.
+
+  Returns
+  -------
+  list[str]
+    The names of the created partitions.
+  """
+  existing = {lower for name, lower, upper in list_partitions(connection)}
+  created = []
+  month = first_month.replace(day=1)
+  while month <= last_month:
+    if month not in existing:
+      create_partition(connection, month)
+      created.append(partition_name(month))
+    month = add_months(month, 1)
+  return created
+
+
+def create_future_partitions(months_ahead=None):
+  """
+  Creates the missing partitions from the current month to months_ahead
+  months later, SHOW_PARTITION_MONTHS_AHEAD by default.
+
+  Returns
+  -------
+  list[str]
+    The names of the created partitions.
+  """
+  if months_ahead is None:
+    months_ahead = app.config['SHOW_PARTITION_MONTHS_AHEAD']
+  this_month = date.today().replace(day=1)
+  with db.engine.begin() as connection:
+    return ensure_partitions(connection, this_month, add_months(this_month, months_ahead))
+
+
+def archive_partition(connection, name, lower, upper):
+  """
+  Moves a partition detached from "Show" to "ShowArchive". It is attached
+  under its archive name, or merged into the archive partition of its month
+  if there is one already.
+  """
+  archive_name = partition_name(lower, ARCHIVE_TABLE)
+  archived = {archive_lower for _, archive_lower, _ in list_partitions(connection, ARCHIVE_TABLE)}
+  if lower in archived:
+    connection.execute(text(f'INSERT INTO "{archive_name}" ({COLUMNS}) SELECT {COLUMNS} FROM "{name}"'))
+    connection.execute(text(f'DROP TABLE "{name}"'))
+    return
+  connection.execute(text(f'ALTER TABLE "{name}" RENAME TO "{archive_name}"'))
+  connection.execute(text(f'''
+    ALTER TABLE "{ARCHIVE_TABLE}" ATTACH PARTITION "{archive_name}" FOR VALUES FROM ('{lower}') TO ('{upper}')
+  '''))
+
+
+def summarize_archived_shows(connection, shows):
+  """
+  Adds archived shows to ShowArchiveSummary.
+
+  Parameters
+  ----------
+  connection : sqlalchemy.engine.Connection
+    The connection archiving the shows.
+  shows : str
+    The SQL of a relation holding the shows, with their venue_id, artist_id
+    and start_time.
+
+  Returns
+  -------
+  list[(int, int)]
+    The venue and artist IDs of the summaries changed.
+  """
+  return connection.execute(text(f'''
+    INSERT INTO "ShowArchiveSummary" AS s (venue_id, artist_id, shows_count, first_start_time, last_start_time)
+    SELECT venue_id, artist_id, count(*), min(start_time), max(start_time)
+    FROM {shows}
+    GROUP BY venue_id, artist_id
+    ON CONFLICT (venue_id, artist_id) DO UPDATE SET
+      shows_count = s.shows_count + excluded.shows_count,
+      first_start_time = least(s.first_start_time, excluded.first_start_time),
+      last_start_time = greatest(s.last_start_time, excluded.last_start_time)
+    RETURNING venue_id, artist_id
+  ''')).fetchall()
+
+
+def touch_show_table(connection):
+  """
+  Records a change of "Show" in TableVersion. Detaching a partition or
+  writing to one directly does not fire the statement trigger of "Show",
+  which the /shows listing validators rely on.
+  """
+  connection.execute(text('''
+    INSERT INTO "TableVersion" (table_name, updated_at) VALUES ('Show', clock_timestamp())
+    ON CONFLICT (table_name) DO UPDATE SET updated_at = EXCLUDED.updated_at
+  '''))
+
+
+def bump_pages(pairs):
+  """
+  Drops the cached pages of the venues and artists of the given pairs, whose
+  archive summaries changed.
+  """
+  for venue_id in {venue_id for venue_id, _ in pairs}:
+    page_cache.bump('venue', venue_id)
+  for artist_id in {artist_id for _, artist_id in pairs}:
+    page_cache.bump('artist', artist_id)
+
+
+def archive_old_shows(archive_after_months=None):
+  """
+  Archives the shows of the months ended more than archive_after_months
+  months ago, SHOW_ARCHIVE_AFTER_MONTHS by default. Each partition is archived
+  in its own transaction, then the shows of the default partition.
+
+  Parameters
+  ----------
+  archive_after_months : int, optional
+    The number of past months kept in "Show". Nothing is archived when None.
+
+  Returns
+  -------
+  (list[str], int)
+    The names of the archived partitions, and the number of shows moved from
+    the default partition.
+  """
+  if archive_after_months is None:
+    archive_after_months = app.config['SHOW_ARCHIVE_AFTER_MONTHS']
+  if archive_after_months is None:
+    return [], 0
+  cutoff = datetime.combine(add_months(date.today().replace(day=1), -archive_after_months), time.min)
+  with db.engine.connect() as connection:
+    old_partitions = [
+      (name, lower, upper) for name, lower, upper in list_partitions(connection)
+      if datetime.combine(upper, time.min) <= cutoff
+    ]
+
+  archived = []
+  for name, lower, upper in old_partitions:
+    with db.engine.begin() as connection:
+      if datetime.combine(upper, time.min) > lock_watermark(connection, 'SHARE'):
+        break
+      connection.execute(text(f'ALTER TABLE "Show" DETACH PARTITION "{name}"'))
+      pairs = summarize_archived_shows(connection, f'"{name}"')
+      archive_partition(connection, name, lower, upper)
+      touch_show_table(connection)
+    bump_pages(pairs)
+    archived.append(name)
+
+  with db.engine.begin() as connection:
+    bound = min(cutoff, lock_watermark(connection, 'SHARE'))
+    months = connection.execute(text(f'''
+      SELECT DISTINCT date_trunc('month', start_time) FROM "{DEFAULT_PARTITION}" WHERE start_time < :bound
+    '''), {'bound': bound}).fetchall()
+    if not months:
+      return archived, 0
+    existing = {lower for _, lower, _ in list_partitions(connection, ARCHIVE_TABLE)}
+    for month, in months:
+      month = month.date()
+      if month not in existing:
+        connection.execute(text(f'''
+          CREATE TABLE "{partition_name(month, ARCHIVE_TABLE)}" PARTITION OF "{ARCHIVE_TABLE}"
+          FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')
+        '''))
+    connection.execute(text(f'CREATE TEMPORARY TABLE archived_shows (LIKE "{DEFAULT_PARTITION}") ON COMMIT DROP'))
+    connection.execute(text(f'''
+      WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" WHERE start_time < :bound RETURNING *)
+      INSERT INTO archived_shows SELECT * FROM moved
+    '''), {'bound': bound})
+    moved = connection.execute(text(f'''
+      INSERT INTO "{ARCHIVE_TABLE}" ({COLUMNS}) SELECT {COLUMNS} FROM archived_shows
+    ''')).rowcount
+    pairs = summarize_archived_shows(connection, 'archived_shows')
+    touch_show_table(connection)
+  bump_pages(pairs)
+  return archived, moved
+
+
+@app.cli.command('partition-shows')
+@click.option('--months-ahead', type=click.IntRange(min=0),
+              help='Months to create partitions for, SHOW_PARTITION_MONTHS_AHEAD by default.')
+@click.option('--archive-after-months', type=click.IntRange(min=0),
+              help='Past months to keep in Show, SHOW_ARCHIVE_AFTER_MONTHS by default.')
+def partition_shows_command(months_ahead, archive_after_months):
+  """Create upcoming monthly Show partitions and archive old ones."""
+  for name in create_future_partitions(months_ahead):
+    click.echo(f'Created {name}.')
+  archived, moved = archive_old_shows(archive_after_months)
+  for name in archived:
+    click.echo(f'Archived {name}.')
+  if moved:
+    click.echo(f'Archived {moved} shows of {DEFAULT_PARTITION}.')
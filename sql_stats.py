@@ -0,0 +1,148 @@
+"""
+Per-request SQL instrumentation and N+1 query detection.
+
+Every statement sent to the database during a request, on any engine, is
+timed with SQLAlchemy's cursor events. At the end of the request the number
+of statements, the total database time and the slowest statement are
+reported in a Server-Timing header, which browser developer tools display,
+e.g.:
+
+  Server-Timing: db;dur=12.4;desc="7 queries", db-slowest;dur=5.1
+
+Statements are also grouped by their normalized SQL, with literals and IN
+lists collapsed, so that the same query run with different parameters counts
+as one. When a request runs one of them more than SQL_REPEAT_THRESHOLD times,
+which is what an N+1 loop looks like, a warning naming the statement is
+logged. With app.testing set, the request fails with RepeatedQueryError
+instead, so the test client raises it.
+
+Statements run by streamed response bodies after the view has returned are
+not included, and neither are those run outside requests, such as CLI
+commands and background threads.
+"""
+import logging
+import re
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_ITEM = r'\s*(?:%\(\w+\)s|[^,()]+)\s*'
+IN_LIST = re.compile(rf'\bIN \((?:{IN_ITEM},)+{IN_ITEM}\)', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+')
+
+
+class RepeatedQueryError(AssertionError):
+  pass
+
+
+def normalize_statement(statement):
+  """
+  Reduces a SQL statement to its shape: literals replaced by ?, IN lists
+  collapsed to a single item and whitespace squeezed.
+  """
+  statement = STRING_LITERAL.sub('?', statement)
+  statement = NUMBER_LITERAL.sub('?', statement)
+  statement = IN_LIST.sub('IN (?)', statement)
+  return WHITESPACE.sub(' ', statement).strip()
+
+
+class RequestStats(object):
+  """
+  The statements run so far by the current request.
+  """
+
+  def __init__(self):
+    self.count = 0
+    self.total = 0.0
+    self.slowest = 0.0
+    self.slowest_statement = None
+    self.shapes = Counter()
+
+  def record(self, statement, duration):
+    self.count += 1
+    self.total += duration
+    if duration > self.slowest:
+      self.slowest = duration
+      self.slowest_statement = statement
+    self.shapes[normalize_statement(statement)] += 1
+
+  def server_timing(self):
+    return f'db;dur={self.total * 1000:.1f};desc="{self.count} queries", db-slowest;dur={self.slowest * 1000:.1f}'
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  if has_request_context():
+    conn.info.setdefault('sql_stats_started', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  started = conn.info.get('sql_stats_started')
+  if started and has_request_context():
+    duration = time.perf_counter() - started.pop()
+    if 'sql_stats' not in g:
+      g.sql_stats = RequestStats()
+    g.sql_stats.record(statement, duration)
+
+
+def handle_error(exception_context):
+  started = exception_context.connection.info.get('sql_stats_started') if exception_context.connection else None
+  if started:
+    started.pop()
+
+
+class SQLStats(object):
+  """
+  Registers the engine event listeners and reports the statistics of each
+  request.
+  """
+
+  def __init__(self):
+    self.app = None
+    self.enabled = False
+
+  def init_app(self, app):
+    self.app = app
+    self.enabled = app.config.get('SQL_STATS_ENABLED', False)
+    if self.enabled:
+      if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(Engine, 'handle_error', handle_error)
+      app.after_request(self.report)
+
+  def report(self, response):
+    stats = g.pop('sql_stats', None)
+    if stats is None:
+      return response
+    if self.app.config.get('SQL_STATS_SERVER_TIMING', True):
+      response.headers.add('Server-Timing', stats.server_timing())
+    logger.debug(
+      '%s %s: %d queries in %.1f ms, slowest %.1f ms: %s',
+      request.method, request.path, stats.count, stats.total * 1000, stats.slowest * 1000, stats.slowest_statement
+    )
+    self.check_repeats(stats)
+    return response
+
+  def check_repeats(self, stats):
+    threshold = self.app.config.get('SQL_REPEAT_THRESHOLD')
+    if not threshold:
+      return
+    repeated = [(shape, count) for shape, count in stats.shapes.most_common() if count > threshold]
+    if not repeated:
+      return
+    message = f'{request.method} {request.path} ran the same statement ' + '; '.join(
+      f'{count} times: {shape}' for shape, count in repeated
+    )
+    if self.app.testing:
+      raise RepeatedQueryError(message)
+    logger.warning('Possible N+1 query. %s', message)
+
+
+sql_stats = SQLStats()